@@ -1,210 +1,687 @@
 import time
+import atexit
 import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import os
-import ctypes
-import winreg
-import emoji
+import sys
+import shutil
+import subprocess
 import logging
-from PIL import Image, ImageDraw, ImageFont
-import webuntis
+import logging.handlers
+import gzip
+import queue
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageOps, ImageFilter
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 import re
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import json
+import math
+import hashlib
+import functools
+import tempfile
+import unicodedata
+import contextlib
+import http.server
+import heapq
+import dataclasses
+from collections import defaultdict, deque
+# requests, emoji, numpy (optional), webuntis and selenium are imported where they are first needed
 
 # Konstanten und Einstellungen (wie in deinem Original-Code)
 APP_PATH = os.path.abspath(os.path.dirname(__file__))
 FONT_FOLDER = os.path.join(APP_PATH, "fonts")
 FONT_NAME = "NotoColorEmoji_WindowsCompatible.ttf"
+FONT_SIZE = 32
+FONT_CHAINS = {  # Fallback-Reihenfolge je Schriftart
+    "emoji": (
+        "C:\\Windows\\Fonts\\seguiemj.ttf",
+        os.path.join(FONT_FOLDER, "HackNerdFont-Regular.ttf"),
+        os.path.join(FONT_FOLDER, "OpenSans-Regular.ttf"),
+    ),
+    "text": (
+        "C:\\Windows\\Fonts\\seguiemj.ttf",
+        os.path.join(FONT_FOLDER, "OpenSans-Regular.ttf"),
+        os.path.join(FONT_FOLDER, "HackNerdFont-Regular.ttf"),
+    ),
+}
 BACKGROUND_PATH = os.path.join(APP_PATH, "background", "old.png")
 TODO_PATH = os.path.join(APP_PATH, "todo.md")
 OUTPUT_DIR = os.path.join(APP_PATH, 'output')
-OUTPUT_IMAGE_PATH = os.path.join(OUTPUT_DIR, 'background.png')
-
-# Logging-Konfiguration (wie in deinem Original-Code)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    handlers=[
-        logging.FileHandler("wallpaper.log"),
-        logging.StreamHandler()
-    ]
-)
+OUTPUT_FORMATS = {  # Dateiendung, Farbmodus, Pillow-Optionen
+    "png": (".png", "RGB", {"format": "PNG", "compress_level": 1}),
+    "png-rgba": (".png", "RGBA", {"format": "PNG", "compress_level": 1}),
+    "bmp": (".bmp", "RGB", {"format": "BMP"}),
+    "jpeg": (".jpg", "RGB", {"format": "JPEG", "quality": 95, "subsampling": 0}),
+}
+REQUESTED_FORMAT = os.getenv("WALLPAPER_FORMAT", "png").strip().lower()
+OUTPUT_FORMAT = REQUESTED_FORMAT if REQUESTED_FORMAT in OUTPUT_FORMATS else "png"  # Unbekannte Formate: PNG
+WALLPAPER_BACKEND = os.getenv("WALLPAPER_BACKEND", "auto")  # auto, windows, gnome, feh, sway oder file
+IN_RENDER_PROCESS = multiprocessing.current_process().name != "MainProcess"  # Läuft als Render-Prozess (auch beim Import unter spawn)
+RENDER_WORKER = os.getenv("WALLPAPER_RENDER_WORKER", "1") == "1"  # Rendern und Kodieren in einem eigenen Prozess
+RENDER_WORKER_MAX_RENDERS = 500  # Danach wird der Render-Prozess ersetzt ...
+RENDER_WORKER_MAX_RSS = 768 * 1024 * 1024  # ... oder sobald er mehr Speicher belegt (Bytes)
+RENDER_TIMEOUT = 120  # Sekunden, danach gilt der Render-Prozess als hängend und wird beendet
+OUTPUT_IMAGE_PATH = os.path.join(OUTPUT_DIR, 'background' + OUTPUT_FORMATS[OUTPUT_FORMAT][0])
+SOURCE_TIMEOUTS = {"todos": 5, "weather": 60, "timetable": 30}  # Sekunden pro Datenquelle
+CACHE_DIR = os.path.join(APP_PATH, 'cache')
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'last_data.json')  # Letzte Daten für den schnellen Start
+STARTUP_MAX_WAIT = 0.5  # Beim Start höchstens so lange auf Datenquellen warten
+METRICS_PATH = os.path.join(APP_PATH, 'metrics.jsonl')  # Eine JSON-Zeile pro gemessenem Schritt
+METRICS_SUMMARY_PATH = os.path.join(CACHE_DIR, 'metrics_summary.json')
+PROFILE_FLAG_PATH = os.path.join(APP_PATH, 'profile_next_update')  # Datei anlegen, um ein Update mit cProfile zu messen
+LOG_PATH = os.path.join(APP_PATH, 'wallpaper.log')
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Danach wird das Log rotiert
+LOG_BACKUPS = 5  # Anzahl der gzip-Archive (wallpaper.log.1.gz ...)
+LOG_ASYNC = os.getenv("WALLPAPER_LOG_ASYNC", "1") == "1"  # Dateizugriffe in einem eigenen Thread
+LOCATION_CONFIG_PATH = os.path.join(APP_PATH, 'location.json')  # Optional: {"city": ..., "lat": ..., "lng": ...}
+LOCATION_CACHE_PATH = os.path.join(CACHE_DIR, 'location.json')
+LOCATION_PROVIDERS = os.getenv("LOCATION_PROVIDERS", "static,ip").split(",")  # Reihenfolge der Anbieter
+LOCATION_TTL = 6 * 60 * 60  # Standort höchstens alle 6 Stunden neu bestimmen
+LOCATION_MIN_DISTANCE_KM = 5  # Kleinere Abweichungen werden ignoriert
+WEATHER_CACHE_PATH = os.path.join(CACHE_DIR, 'weather.json')
+WEATHER_FIELDS = "temperature,cloudCover"
+WEATHER_TTL = int(os.getenv("WEATHER_TTL", 15 * 60))  # So lange gilt ein Wetterwert als aktuell
+WEATHER_MAX_BACKOFF = 60 * 60  # Längste Pause nach Fehlern
+TIMETABLE_TTL = int(os.getenv("TIMETABLE_TTL", 10 * 60))  # Stundenplan höchstens alle 10 Minuten abrufen
+TIMETABLE_MAX_BACKOFF = 30 * 60  # Längste Pause nach fehlgeschlagenen Stundenplan-Abrufen
+TIMETABLE_DAYS = 7  # So viele Tage ab heute holt ein einziger my_timetable-Aufruf
+TIMETABLE_CACHE_PATH = os.path.join(CACHE_DIR, 'timetable.json')
+WEEKDAYS = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
+CONTROL_PORT = int(os.getenv("WALLPAPER_CONTROL_PORT", 8765))  # Lokale HTTP-API auf 127.0.0.1, 0 schaltet sie ab
+CONTROL_TOKEN = os.getenv("WALLPAPER_CONTROL_TOKEN")  # Optional: muss als X-Token-Header mitgeschickt werden
+CONTROL_MAX_WAIT = 0.1  # Nach Befehlen nicht auf langsame Datenquellen warten
+WATCHED_PATHS = [TODO_PATH, BACKGROUND_PATH]  # Nur diese Dateien lösen ein Update aus
+WATCH_MODE = os.getenv("WALLPAPER_WATCH_MODE", "auto")  # auto, events oder poll (Netzlaufwerke, Sync-Ordner)
+WATCH_POLL_INTERVAL = 1.0  # Sekunden zwischen zwei stat()-Aufrufen im Polling-Modus
+SYNC_FOLDER_NAMES = ("onedrive", "dropbox", "google drive", "googledrive", "icloud", "nextcloud")
+UPDATE_INTERVAL = 30 * 60  # Spätestens alle 30 Minuten, sonst nur zu erwarteten Änderungen
+REFRESH_DEBOUNCE = 1.0  # Wartezeit nach der letzten Änderung
+REFRESH_MAX_DELAY = 5.0  # Spätestens dann wird trotz weiterer Änderungen gerendert
+EFFECTS = set(filter(None, os.getenv("WALLPAPER_EFFECTS", "dim,shadow").split(",")))  # dim, blur, shadow
+
+# Logging-Konfiguration
+def gzip_rotator(source, dest):
+    """Compresses the rotated log instead of just renaming it"""
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def rotating_handler(path, fmt):
+    """Size-based rotation keeping LOG_BACKUPS compressed archives"""
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = gzip_rotator
+    handler.setFormatter(logging.Formatter(fmt))
+    return handler
+
+def queued(*handlers):
+    """Moves the work of handlers to a background thread when LOG_ASYNC is set"""
+    if not LOG_ASYNC:
+        return list(handlers)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Flushes the queue on exit
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))  # The real handlers format the record
+    return [queue_handler]
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+if not IN_RENDER_PROCESS:  # Render processes send their records to the main process instead
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=queued(rotating_handler(LOG_PATH, '%(asctime)s - %(message)s'), stream_handler)
+    )
+    if REQUESTED_FORMAT != OUTPUT_FORMAT:
+        logging.warning(f"Unknown WALLPAPER_FORMAT {REQUESTED_FORMAT!r}, using png (allowed: {', '.join(OUTPUT_FORMATS)})")
+
+# --------------------------
+# TRACING
+# --------------------------
+class Tracer:
+    """Writes one JSON line per timed stage and keeps rolling p50/p95 per stage"""
+    def __init__(self, path, window=200):
+        self.logger = logging.getLogger("metrics")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)  # Spans are written whatever level the root logger has
+        if path:
+            for handler in queued(rotating_handler(path, '%(message)s')):
+                self.logger.addHandler(handler)
+        self.durations = defaultdict(lambda: deque(maxlen=window))
+        self.lock = threading.Lock()
+        self.update_id = 0
+
+    @contextlib.contextmanager
+    def span(self, stage, **fields):
+        """Times the block; fields such as cache or bytes can be added to the yielded record"""
+        record = {"stage": stage, "update": self.update_id, **fields}
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            record["time"] = datetime.now().isoformat(timespec='milliseconds')
+            with self.lock:
+                self.durations[stage].append(record["duration_ms"])
+            self.logger.info(json.dumps(record, ensure_ascii=False))
+
+    def summary(self):
+        """Rolling p50 and p95 in milliseconds of every stage"""
+        with self.lock:
+            summary = {}
+            for stage, durations in self.durations.items():
+                ordered = sorted(durations)
+                summary[stage] = {
+                    "count": len(ordered),
+                    "p50_ms": ordered[round((len(ordered) - 1) * 0.50)],
+                    "p95_ms": ordered[round((len(ordered) - 1) * 0.95)],
+                }
+            return summary
+
+    def write_summary(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding='utf-8') as file:
+            json.dump(self.summary(), file, indent=2)
+
+tracer = Tracer(None if IN_RENDER_PROCESS else METRICS_PATH)
+profile_run = None  # Zeitstempel des gerade profilierten Updates
+
+@contextlib.contextmanager
+def profiled(run, part):
+    """Profiles the block with cProfile into its own file when run is set.
+
+    cProfile only sees the thread it was enabled in, so the update, every
+    source fetch and the render process each write profile-<run>-<part>.prof.
+    """
+    if run is None:
+        yield
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        stats_path = os.path.join(CACHE_DIR, f"profile-{run}-{part}.prof")
+        profiler.dump_stats(stats_path)
+        logging.info(f"Profile of {part} written to {stats_path}")
+
+@contextlib.contextmanager
+def profile_if_requested():
+    """Profiles one update, its source fetches and its rendering while PROFILE_FLAG_PATH exists"""
+    global profile_run
+    if not os.path.exists(PROFILE_FLAG_PATH):
+        yield
+        return
+
+    os.remove(PROFILE_FLAG_PATH)
+    profile_run = f"{datetime.now():%Y%m%d-%H%M%S}"
+    try:
+        with profiled(profile_run, "update"):
+            yield
+    finally:
+        profile_run = None
 
 # Funktionen (wie in deinem Original-Code)
-def load_font():
-    """Loads the font with automatic error handling"""
-    font_paths = [
-        #os.path.join(FONT_FOLDER, FONT_NAME),  # Primary path
-        "C:\\Windows\\Fonts\\seguiemj.ttf"     # Windows fallback
-    ]
-    
-    for path in font_paths:
+@functools.lru_cache(maxsize=None)
+def load_face(path, size):
+    """Parses a font file once per process"""
+    return ImageFont.truetype(path, size=size, encoding="unic")
+
+@functools.lru_cache(maxsize=None)
+def load_font(chain="emoji", size=FONT_SIZE):
+    """Loads the first working font of a fallback chain"""
+    for path in FONT_CHAINS[chain]:
         try:
-            return ImageFont.truetype(path, size=32, encoding="unic")
+            return load_face(path, size)
         except Exception as e:
             logging.warning(f"Font not found or other error: {path}")
     
     logging.error("No working font found!")
     return ImageFont.load_default()
 
-def manage_log_file():
-    log_file = "wallpaper.log"
-    if not os.path.exists(log_file):
-        return
+@functools.lru_cache(maxsize=4096)
+def text_length(text, font):
+    """Cached advance width of text in pixels"""
+    return font.getlength(text)
 
-    with open(log_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    if len(lines) > 5000:
-        # Remove first 1000 lines
-        with open(log_file, "w", encoding="utf-8") as f:
-            f.writelines(lines[1000:])
+@functools.lru_cache(maxsize=4096)
+def text_bbox(text, font):
+    """Cached bounding box of text"""
+    return font.getbbox(text)
 
 #---------------------------
 # Code for printing weather
 #---------------------------   
 
-def get_weather_by_location(now):
-    logging.info("Starting weather data retrieval...")
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--use-fake-ui-for-media-stream")
-    options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Chrome(options=options)
-    driver.set_page_load_timeout(30)  # Set a timeout to prevent hanging
+@functools.lru_cache(maxsize=None)
+def http_session():
+    """Shared session so repeated API calls reuse the connection"""
+    import requests
+    return requests.Session()
 
-    api_key = os.getenv("tomorrowio")
-    if not api_key:
-        return "Error: TOMORROWIO environment variable not set."
+def extract_city(addr):
+    """Extracts the city name from a postal address"""
+    city = re.search(r'\d{4}\s([a-zA-ZäöüÄÖÜß]+)', addr)
+    if not city:
+        # Try alternate pattern for city extraction
+        city = re.search(r'([a-zA-Z]+)', addr)
+    return city.group(1) if city else None
 
-    try:
-        logging.info("Accessing location service...")
-        driver.get("https://www.gps-coordinates.net/my-location")
-        driver.execute_cdp_cmd("Browser.grantPermissions", {
-            "origin": driver.current_url,
-            "permissions": ["geolocation"]
-        })
-        
-        wait = WebDriverWait(driver, 20)  # Increased timeout to 20 seconds
-        
-        # Wait for page to fully load before checking elements
-        time.sleep(2)
-        
-        logging.info("Waiting for location data...")
+class StaticLocationProvider:
+    """Reads a fixed location from LOCATION_CONFIG_PATH"""
+    name = "static"
+
+    def locate(self):
         try:
+            with open(LOCATION_CONFIG_PATH, encoding='utf-8') as file:
+                config = json.load(file)
+        except FileNotFoundError:
+            return None
+        return {"city": config.get("city"), "lat": float(config["lat"]), "lng": float(config["lng"])}
+
+class IPLocationProvider:
+    """Locates the machine by its public IP address, no browser needed"""
+    name = "ip"
+    url = "https://ipapi.co/json/"
+
+    def locate(self):
+        response = http_session().get(self.url, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        return {"city": data.get("city"), "lat": float(data["latitude"]), "lng": float(data["longitude"])}
+
+class BrowserLocationProvider:
+    """Asks gps-coordinates.net through a headless Chrome (slow, last resort)"""
+    name = "browser"
+
+    def locate(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--use-fake-ui-for-media-stream")
+        options.add_argument("--disable-dev-shm-usage")
+
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(30)  # Set a timeout to prevent hanging
+        try:
+            logging.info("Accessing location service...")
+            driver.get("https://www.gps-coordinates.net/my-location")
+            driver.execute_cdp_cmd("Browser.grantPermissions", {
+                "origin": driver.current_url,
+                "permissions": ["geolocation"]
+            })
+
+            wait = WebDriverWait(driver, 20)
             # First get the element references (without .text)
             addr_element = wait.until(EC.presence_of_element_located((By.ID, "addr")))
             # Then wait until it has non-empty text
             wait.until(lambda d: addr_element.text.strip() != "")
             addr = addr_element.text
-            
-            lng_element = wait.until(EC.presence_of_element_located((By.ID, "lng")))
-            lat_element = wait.until(EC.presence_of_element_located((By.ID, "lat")))
-            
-            lng = lng_element.text
-            lat = lat_element.text
-            
-            logging.info(f"Location retrieved: {addr}")
+
+            lng = wait.until(EC.presence_of_element_located((By.ID, "lng"))).text
+            lat = wait.until(EC.presence_of_element_located((By.ID, "lat"))).text
+            return {"city": extract_city(addr), "lat": float(lat), "lng": float(lng)}
+        finally:
+            driver.quit()
+            logging.info("Location browser closed")
+
+location_providers = {
+    provider.name: provider
+    for provider in (StaticLocationProvider, IPLocationProvider, BrowserLocationProvider)
+}
+
+def distance_km(a, b):
+    """Great-circle distance between two locations"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (a["lat"], a["lng"], b["lat"], b["lng"]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+class LocationCache:
+    """Resolves the location through the providers and keeps it on disk for a while"""
+    def __init__(self, providers, path, ttl, min_distance_km):
+        self.providers = providers
+        self.path = path
+        self.ttl = ttl
+        self.min_distance_km = min_distance_km
+        self.location = None
+
+    def load(self):
+        if self.location is None:
+            try:
+                with open(self.path, encoding='utf-8') as file:
+                    self.location = json.load(file)
+            except (FileNotFoundError, ValueError):
+                pass
+        return self.location
+
+    def save(self, location):
+        self.location = location
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding='utf-8') as file:
+            json.dump(location, file)
+
+    def resolve(self):
+        for provider in self.providers:
+            try:
+                location = provider.locate()
+            except Exception as e:
+                logging.warning(f"Location provider '{provider.name}' failed: {e}")
+                continue
+            if location:
+                logging.info(f"Location from '{provider.name}': {location['city']}")
+                location["provider"] = provider.name
+                return location
+        return None
+
+    def get(self):
+        """Returns the cached location, refreshing it once the TTL has expired"""
+        cached = self.load()
+        if cached and time.time() - cached["time"] < self.ttl:
+            return cached
+
+        with tracer.span("location", cache="miss") as span:
+            location = self.resolve()
+            span["provider"] = location and location.get("provider")
+        if not location:
+            return cached  # Better an old location than none
+
+        if cached and distance_km(cached, location) < self.min_distance_km:
+            location = dict(cached)  # Still the same place, keep the known city
+        location["time"] = time.time()
+        self.save(location)
+        return location
+
+location_cache = LocationCache(
+    [location_providers[name.strip()]() for name in LOCATION_PROVIDERS if name.strip() in location_providers],
+    LOCATION_CACHE_PATH, LOCATION_TTL, LOCATION_MIN_DISTANCE_KM
+)
+
+class WeatherCache:
+    """Persistent tomorrow.io cache that serves stale data while it refreshes in the background"""
+    url = "https://api.tomorrow.io/v4/weather/realtime"
+
+    def __init__(self, path, ttl, max_backoff):
+        self.path = path
+        self.ttl = ttl
+        self.max_backoff = max_backoff
+        self.backoff = 0
+        self.retry_at = 0
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.on_update = None  # Called after new values were stored
+        try:
+            with open(path, encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding='utf-8') as file:
+            json.dump(self.entries, file)
+
+    def fail(self, error, retry_after=0):
+        """Doubles the pause before the next request (at least retry_after seconds)"""
+        with self.lock:
+            self.backoff = min(max(self.backoff * 2, 60, retry_after), self.max_backoff)
+            self.retry_at = time.time() + self.backoff
+        logging.error(f"Error fetching weather data, retrying in {self.backoff}s: {error}")
+
+    def fetch(self, key, location, fields, api_key):
+        """Requests fresh values and stores them, returns None on failure"""
+        try:
+            with tracer.span("weather_fetch") as span:
+                params = {"location": location, "apikey": api_key, "fields": fields, "units": "metric"}
+                response = http_session().get(self.url, params=params, timeout=15)
+                span["status"] = response.status_code
+                span["bytes"] = len(response.content)
+                if response.status_code == 429:
+                    retry_after = response.headers.get("Retry-After", "")
+                    self.fail("Rate limit reached", int(retry_after) if retry_after.isdigit() else 0)
+                    return None
+                response.raise_for_status()
+                values = response.json()['data']['values']
         except Exception as e:
-            logging.error(f"Timeout waiting for location elements: {e}")
-            return "Wetter: Standort konnte nicht ermittelt werden."
-        
-        if not addr:
-            logging.error("Empty location data received")
-            return "Error: Could not retrieve GPS coordinates"
-
-        city = re.search(r'\d{4}\s([a-zA-ZäöüÄÖÜß]+)', addr)
-        if not city:
-            # Try alternate pattern for city extraction
-            city = re.search(r'([a-zA-Z]+)', addr)
-            
-        city = city.group(1) if city else "Unknown"
-        logging.info(f"Using city: {city}")
-        
-        # Use address directly if city extraction fails
-        location = city.lower() if city != "Unknown" else addr
-        
-        logging.info(f"Retrieving weather for {location}...")
-        url = f"https://api.tomorrow.io/v4/weather/realtime?location={location}&apikey={api_key}&fields=temperature,cloudCover&units=metric"
-        response = requests.get(url, timeout=15)  # Increased timeout to 15 seconds
-        response.raise_for_status()
-        data = response.json()
-        print(data)
-        temperature = data['data']['values']['temperature']
-        condition = data['data']['values']['cloudCover']
-        weather = f"Wetter in {city}: {temperature}°C, Bewölkung: {condition}%\n\nStand: {now}"
-        
+            self.fail(e)
+            return None
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+        entry = {"values": values, "time": time.time()}
+        with self.lock:
+            self.backoff = 0
+            self.entries[key] = entry
+            self.save()
         logging.info("Weather data successfully retrieved")
-        return weather
-    
-    except requests.RequestException as e:
-        logging.error(f"Error fetching weather data: {e}")
-        return f"Error fetching weather data: {e}"
-    except Exception as e:
-        logging.error(f"Weather error: {e}")
-        return f"An error occurred: {e}"
-    finally:
-        try:
-            driver.quit()
-            logging.info("Weather browser closed")
-        except:
-            pass
+        if self.on_update:
+            self.on_update()
+        return entry
+
+    def invalidate(self):
+        """Marks every entry as stale so the next get() refreshes it"""
+        with self.lock:
+            for entry in self.entries.values():
+                entry["time"] = 0
+            self.backoff = self.retry_at = 0
+
+    def expires_at(self):
+        """When the newest entry goes stale (or the backoff ends), None without entries"""
+        with self.lock:
+            if not self.entries:
+                return None
+            stale = max(entry["time"] for entry in self.entries.values()) + self.ttl
+            return datetime.fromtimestamp(max(stale, self.retry_at))
+
+    def get(self, location, fields, api_key, span=None):
+        """Returns the cached entry at once and refreshes it in the background when stale"""
+        span = {} if span is None else span
+        key = f"{location}|{fields}"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry["time"] < self.ttl:
+                span["cache"] = "hit"
+                return entry
+            span["cache"] = "stale" if entry else "miss"
+            if key in self.refreshing or time.time() < self.retry_at:
+                return entry
+            self.refreshing.add(key)
+
+        if entry is None:
+            return self.fetch(key, location, fields, api_key)  # Nothing to show yet, wait for it
+        threading.Thread(target=self.fetch, args=(key, location, fields, api_key), daemon=True).start()
+        return entry
+
+weather_cache = WeatherCache(WEATHER_CACHE_PATH, WEATHER_TTL, WEATHER_MAX_BACKOFF)
+
+def get_weather_by_location():
+    """Returns the weather text for the current location or None if unknown"""
+    api_key = os.getenv("tomorrowio")
+    if not api_key:
+        logging.error("TOMORROWIO environment variable not set.")
+        return None
+
+    location_data = location_cache.get()
+    if not location_data:
+        logging.error("No location provider returned a location")
+        return "Wetter: Standort konnte nicht ermittelt werden."
+
+    city = location_data["city"] or "Unknown"
+    # Use the coordinates directly if no city is known
+    location = city.lower() if location_data["city"] else f"{location_data['lat']},{location_data['lng']}"
+
+    with tracer.span("weather") as span:
+        entry = weather_cache.get(location, WEATHER_FIELDS, api_key, span)
+    if not entry:
+        return None
+
+    temperature = entry['values']['temperature']
+    condition = entry['values']['cloudCover']
+    fetched = datetime.fromtimestamp(entry['time']).strftime('%H:%M:%S')
+    return f"Wetter in {city}: {temperature}°C, Bewölkung: {condition}%\n\nStand: {fetched}"
 
 # --------------------------
 # WALLPAPER FUNCTIONALITY
 # --------------------------
-def set_wallpaper(image_path):
-    """Changes the Windows wallpaper"""
-    try:
-        with winreg.OpenKey(
-            winreg.HKEY_CURRENT_USER,
+class WindowsBackend:
+    """Sets the wallpaper through the registry and SystemParametersInfoW"""
+    name = "windows"
+
+    def __init__(self):
+        import ctypes
+        import winreg
+        self.ctypes = ctypes
+        self.winreg = winreg
+        self.user32 = ctypes.windll.user32
+        self.user32.SetProcessDPIAware()  # Echte Pixel statt skalierter Werte
+
+    def display_size(self):
+        return self.user32.GetSystemMetrics(0), self.user32.GetSystemMetrics(1)
+
+    def monitors(self):
+        """(left, top, width, height) of every monitor on the virtual desktop"""
+        from ctypes import wintypes
+        rects = []
+        def collect(monitor, dc, rect, data):
+            r = rect.contents
+            rects.append((r.left, r.top, r.right - r.left, r.bottom - r.top))
+            return True
+        callback_type = self.ctypes.WINFUNCTYPE(
+            self.ctypes.c_int, wintypes.HMONITOR, wintypes.HDC, self.ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+        )
+        self.user32.EnumDisplayMonitors(None, None, callback_type(collect), 0)
+        return rects
+
+    def apply(self, image_path, span=False):
+        with self.winreg.OpenKey(
+            self.winreg.HKEY_CURRENT_USER,
             "Control Panel\\Desktop",
-            0, winreg.KEY_SET_VALUE
+            0, self.winreg.KEY_SET_VALUE
         ) as key:
-            winreg.SetValueEx(key, "Wallpaper", 0, winreg.REG_SZ, image_path)
+            self.winreg.SetValueEx(key, "Wallpaper", 0, self.winreg.REG_SZ, image_path)
+            # "22" = Spannen über alle Monitore, "10" = Füllen
+            self.winreg.SetValueEx(key, "WallpaperStyle", 0, self.winreg.REG_SZ, "22" if span else "10")
+            self.winreg.SetValueEx(key, "TileWallpaper", 0, self.winreg.REG_SZ, "0")
         
         SPI_SETDESKWALLPAPER = 20
-        ctypes.windll.user32.SystemParametersInfoW(SPI_SETDESKWALLPAPER, 0, image_path, 3)
+        self.user32.SystemParametersInfoW(SPI_SETDESKWALLPAPER, 0, image_path, 3)
+
+class CommandBackend:
+    """Sets the wallpaper by running a desktop tool such as gsettings, feh or swaymsg"""
+    commands = {
+        "gnome": [
+            ["gsettings", "set", "org.gnome.desktop.background", "picture-uri", "file://{path}"],
+            ["gsettings", "set", "org.gnome.desktop.background", "picture-uri-dark", "file://{path}"],
+        ],
+        "feh": [["feh", "--no-fehbg", "--bg-fill", "{path}"]],
+        "sway": [["swaymsg", "output", "*", "bg", "{path}", "fill"]],
+    }
+
+    def __init__(self, name):
+        self.name = name
+
+    def display_size(self):
+        return None
+
+    def monitors(self):
+        return []
+
+    def apply(self, image_path, span=False):
+        for command in self.commands[self.name]:
+            subprocess.run([part.format(path=image_path) for part in command], check=True, timeout=10)
+
+class FileBackend:
+    """Only writes the image, for headless machines and benchmarks"""
+    name = "file"
+
+    def display_size(self):
+        return None
+
+    def monitors(self):
+        return []
+
+    def apply(self, image_path, span=False):
+        pass
+
+def select_backend(name):
+    """Creates the wallpaper backend, "auto" picks the one matching this desktop"""
+    if name == "auto":
+        desktop = os.getenv("XDG_CURRENT_DESKTOP", "").lower()
+        if sys.platform == "win32":
+            name = "windows"
+        elif os.getenv("SWAYSOCK") and shutil.which("swaymsg"):
+            name = "sway"
+        elif "gnome" in desktop and shutil.which("gsettings"):
+            name = "gnome"
+        elif os.getenv("DISPLAY") and shutil.which("feh"):
+            name = "feh"
+        else:
+            name = "file"
+
+    if name == "windows":
+        return WindowsBackend()
+    if name in CommandBackend.commands:
+        return CommandBackend(name)
+    return FileBackend()
+
+wallpaper_backend = FileBackend() if IN_RENDER_PROCESS else select_backend(WALLPAPER_BACKEND)
+logging.info(f"Using wallpaper backend: {wallpaper_backend.name}")
+
+def set_wallpaper(image_path, span=False):
+    """Changes the desktop wallpaper, span stretches one image across all monitors. Returns True on success"""
+    try:
+        wallpaper_backend.apply(image_path, span)
         logging.info("Wallpaper changed successfully")
+        return True
     except Exception as e:
         logging.error(f"Error changing wallpaper: {str(e)}")
+        return False
 
-def process_todos():
-    """Processes the to-do list"""
-    try:
-        with open(TODO_PATH, encoding='utf-8') as file:
-            todos = [emoji.emojize(line.rstrip(), language='alias') for line in file]
-    except FileNotFoundError:
-        logging.error(f"To-do file not found: {TODO_PATH}")
-        return []
+EXPIRY_PATTERN = re.compile(r"(\d{2})\.(\d{2})\.(\d{4}):\s*")  # "- [ ] 24.12.2026: Geschenke kaufen"
 
-    processed = []
-    mark_done = False
-    done_indent_level = -1
+class TodoLine:
+    """One line of todo.md with its parsed and rendered state"""
+    __slots__ = ("raw", "indent", "checked", "prefix", "text", "expires", "carry_in", "carry_out", "rows")
+
+    def __init__(self, raw):
+        import emoji
+
+        self.raw = raw
+        self.carry_in = self.carry_out = None
+        self.rows = []
 
-    for raw_line in todos:
         # Initialize variables
         prefix = task_text = ""
-        is_checked = should_strikethrough = False
+        line = emoji.emojize(raw, language='alias')
 
         # Processing steps
-        indent_level = len(raw_line) - len(raw_line.lstrip('\t'))
-        todo_item = raw_line.lstrip('\t')
+        self.indent = len(line) - len(line.lstrip('\t'))
+        todo_item = line.lstrip('\t')
 
         # Checkbox processing
+        self.checked = False
+        has_checkbox = todo_item.startswith(("- [x]", "- [ ]"))
         if todo_item.startswith("- [x]"):
-            is_checked = True
+            self.checked = True
             text = todo_item.replace("- [x]", "-").strip()
         elif todo_item.startswith("- [ ]"):
             text = todo_item.replace("- [ ]", "-").strip()
@@ -219,134 +696,469 @@ def process_todos():
         else:
             task_text = text
         
-        # NOT WORKING: EXPIRING TASKS
-        # Check for expiration dates - FIXED: moved after task_text is defined
-        # date_match = re.search(r"- \[.\] (\d{2})\.(\d{2})\.(\d{4}):", raw_line)
-        # if date_match:
-        #     try:
-        #         # Extract just the date part from the match
-        #         day = date_match.group(1)
-        #         month = date_match.group(2)
-        #         year = date_match.group(3)
-        #         date_str = f"{day}.{month}.{year}"
-
-        #         exp_date = datetime.strptime(date_str, "%d.%m.%Y").date()
-
-        #         if exp_date < datetime.now().date():
-        #             continue  # Skip expired tasks
-
-        #         task_text = task_text.replace(date_match.group(0), "", 1)  # Remove full match
-        #     except ValueError:
-        #         print(f"Invalid date: {date_str}")
-        
+        # Expiring tasks: hidden from the day after their date on
+        self.expires = None
+        date_match = EXPIRY_PATTERN.match(task_text) if has_checkbox else None
+        if date_match:
+            day, month, year = date_match.groups()
+            try:
+                self.expires = datetime(int(year), int(month), int(day)).date()
+                task_text = task_text[date_match.end():]
+            except ValueError:
+                logging.warning(f"Invalid date: {day}.{month}.{year}")
+
+        # Wrapping happens when rendering, where the font is known
+        self.prefix = prefix
+        self.text = task_text
+
+    def evaluate(self, carry):
+        """Applies the done state inherited from the lines above, returns the new state"""
+        if self.expires and self.expires < datetime.now().date():
+            self.rows = []  # Expired tasks are left out as if the line did not exist
+            self.carry_in = self.carry_out = carry
+            return carry
+
+        mark_done, done_indent_level = carry
+        is_checked = self.checked
+        should_strikethrough = False
+
         # Done status
         if is_checked:
-            if indent_level == 0:
+            if self.indent == 0:
                 mark_done = True
-                done_indent_level = indent_level
+                done_indent_level = self.indent
             else:
-                done_indent_level = indent_level
+                done_indent_level = self.indent
                 mark_done = True
                 should_strikethrough = True
         
-        if mark_done and indent_level > done_indent_level:
+        if mark_done and self.indent > done_indent_level:
             is_checked = True
             should_strikethrough = True
 
-        # Calculate length of the formatted text
-        formatted_text = f"{prefix} {task_text}"
-        tab_count = formatted_text.count('\t')
-        formatted_length = len(formatted_text) + (tab_count * 3)  # Each tab is 4 characters, so add 3 for each
+        self.rows = [(self.prefix, self.text, is_checked, self.indent, should_strikethrough)]
+        if not is_checked:
+            mark_done = False
+
+        self.carry_in = carry
+        self.carry_out = (mark_done, done_indent_level)
+        return self.carry_out
+
+class TodoDocument:
+    """Incremental parser for todo.md that only reprocesses changed lines"""
+    def __init__(self, path):
+        self.path = path
+        self.lines = []
+        self.rows = []
+        self.changes = None  # (first row, rows removed, rows added) of the last update
+        self.day = None  # Date of the last read, expired tasks are hidden once it changes
+        self.unsaved = None  # Raw lines changed through the control API, not yet written to the file
+        self.lock = threading.Lock()
+
+    def update(self, raw_lines):
+        """Diffs raw_lines against the previous parse and returns all rows"""
+        old = self.lines
+
+        # Unchanged lines at the start and at the end
+        start = 0
+        limit = min(len(old), len(raw_lines))
+        while start < limit and old[start].raw == raw_lines[start]:
+            start += 1
+        old_end, new_end = len(old), len(raw_lines)
+        while old_end > start and new_end > start and old[old_end - 1].raw == raw_lines[new_end - 1]:
+            old_end -= 1
+            new_end -= 1
+
+        removed = sum(len(line.rows) for line in old[start:old_end])
+        lines = old[:start] + [TodoLine(raw) for raw in raw_lines[start:new_end]] + old[old_end:]
 
-        if formatted_length > 55:
+        # Re-evaluate until the inherited done state matches the previous parse again
+        carry = lines[start - 1].carry_out if start else (False, -1)
+        i = start
+        while i < len(lines):
+            line = lines[i]
+            if i >= new_end:
+                if line.carry_in == carry:
+                    break
+                removed += len(line.rows)
+            carry = line.evaluate(carry)
+            i += 1
+
+        row_start = sum(len(line.rows) for line in lines[:start])
+        added = sum(len(line.rows) for line in lines[start:i])
+        self.lines = lines
+        self.rows = [row for line in lines for row in line.rows]
+        self.changes = (row_start, removed, added)
+        return self.rows
+
+    def read_lines(self):
+        """Raw lines of the file, None if it is missing"""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return [line.rstrip() for line in file]
+        except FileNotFoundError:
+            logging.error(f"To-do file not found: {self.path}")
+            return None
+
+    def read(self):
+        """Reads the file and updates the parse, returns [] if it is missing"""
+        with self.lock:
+            if self.unsaved is not None:
+                return self.rows  # The model is ahead of the file until save() ran
+            raw_lines = self.read_lines()
+            if raw_lines is None:
+                return []
+            return self.parse(raw_lines)
+
+    def parse(self, raw_lines):
+        today = datetime.now().date()
+        if today != self.day:
+            if any(line.expires and line.expires < today for line in self.lines if line.rows):
+                self.lines = []  # Parse everything again so the expired tasks disappear
+            self.day = today
+
+        rows = self.update(raw_lines)
+        row_start, removed, added = self.changes
+        if removed or added:
+            logging.info(f"To-do list changed: {removed} row(s) replaced by {added} at row {row_start}")
+        return rows
+
+    def edit(self, change):
+        """Applies change(raw_lines) -> raw_lines to the model at once; save() writes the file later"""
+        with self.lock:
+            raw_lines = self.unsaved if self.unsaved is not None else self.read_lines() or []
+            raw_lines = change(list(raw_lines))
+            self.parse(raw_lines)
+            self.unsaved = raw_lines
+
+    def save(self):
+        """Writes edits made through edit() to the file.
+
+        If that fails the edits are dropped, so the next read() goes back to
+        the file instead of ignoring it for good.
+        """
+        with self.lock:
+            if self.unsaved is None:
+                return
+            target = os.path.realpath(self.path)  # Replace the file a symlink points to, not the link
+            temp_path = None
             try:
-                space_index = task_text[50:].index(" ") + 50
-                first_part = task_text[0:space_index]
-                second_part = task_text[space_index:]
+                fd, temp_path = tempfile.mkstemp(suffix=".md", dir=os.path.dirname(target))
+                with os.fdopen(fd, "w", encoding='utf-8') as file:
+                    file.writelines(line + "\n" for line in self.unsaved)
+                with contextlib.suppress(FileNotFoundError):
+                    shutil.copymode(target, temp_path)  # mkstemp creates 0600
+                os.replace(temp_path, target)
+            except Exception:
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            finally:
+                self.unsaved = None
 
-                processed.append((prefix, first_part, is_checked, indent_level, should_strikethrough))
-                processed.append(("", second_part, is_checked, indent_level + 0.25, should_strikethrough))
-                continue
+    def next_expiry(self):
+        """Midnight after the earliest due date that is still shown, None if there is none"""
+        dates = [line.expires for line in self.lines if line.expires and line.rows]
+        if not dates:
+            return None
+        return datetime.combine(min(dates) + timedelta(days=1), datetime.min.time())
 
-            except ValueError:
-                task_text = task_text[:55]
-                #task_text = task_text[:55] + "\n  " + task_text[55:]
+todo_document = TodoDocument(TODO_PATH)
 
-        processed.append((prefix, task_text, is_checked, indent_level, should_strikethrough))
-        if not is_checked:
-            mark_done = False
+def process_todos():
+    """Processes the to-do list"""
+    return todo_document.read()
 
-    return processed
+@dataclasses.dataclass(frozen=True, slots=True)
+class Lesson:
+    """One period of the timetable with its substitution, cancellation and room change"""
+    start: datetime
+    end: datetime
+    subject: str
+    room: str
+    teacher: str
+    cancelled: bool = False
+    substitution: bool = False
+    subst_text: str = ""
+    original_room: str = ""  # Nur gesetzt, wenn der Raum geändert wurde
 
-def time_table(weather_data):
-    """Fetches the timetable"""
-    # Zugangsdaten und Schul-Info
-    username = "metzjon"
-    password = os.getenv("WEBUNTIS_PASSWORD")  # Passwort aus Umgebungsvariablen
-    school = "bg-brg-keimgasse"
-    baseurl = "https://neilo.webuntis.com"  # WebUntis-URL deiner Schule
+    @classmethod
+    def from_period(cls, period):
+        """Converts a webuntis period object"""
+        def first_name(attribute):
+            items = getattr(period, attribute, None)
+            try:
+                return items[0].name if items else ""
+            except Exception:  # webuntis raises if an id cannot be resolved
+                return ""
 
-    try:
-        # Session starten
-        session = webuntis.Session(
-            username=username,
-            password=password,
-            school=school,
-            useragent='WebUntisPython',
-            server=baseurl
-        ).login()
-
-        heute = datetime.now() + timedelta(days=0)   
-
-        timetable = session.my_timetable(
-            start=heute,
-            end=heute
+        room = first_name("rooms")
+        original_room = first_name("original_rooms")
+        subst_text = getattr(period, "substText", "") or getattr(period, "info", "") or ""
+        return cls(
+            start=period.start,
+            end=period.end,
+            subject=first_name("subjects") or "Kein Fach",
+            room=room or "Kein Raum",
+            teacher=first_name("teachers"),
+            cancelled=period.code == 'cancelled',
+            substitution=period.code == 'irregular' or bool(getattr(period, "substText", None)),
+            subst_text=subst_text,
+            original_room=original_room if original_room and original_room != room else "",
         )
-        
-        sorted_timetable = sorted(timetable, key=lambda lesson: lesson.start)
-        
-        lessons = []
-        sorted_timetable = sorted(timetable, key=lambda lesson: lesson.start)
-
-        # Anfang des Schultages
-        school_day_start = datetime.combine(heute.date(), datetime.strptime("08:00", "%H:%M").time())
-        previous_end = school_day_start
-        for lesson in sorted_timetable:
-            if lesson.code == 'cancelled':
-                continue
 
-            start = lesson.start
-            end = lesson.end
-            subject = lesson.subjects[0].name if lesson.subjects else "Kein Fach"
-            room = lesson.rooms[0].name if lesson.rooms else "Kein Raum"
+    @property
+    def key(self):
+        """Identifies the same period across fetches"""
+        return self.start, self.end, self.subject
 
-            # Freistunde vor dieser Stunde?
-            if (start - previous_end).total_seconds() > 15 * 60:
-                lessons.append(f"{previous_end.strftime('%H:%M')} - {start.strftime('%H:%M')}: FREI!!!")
-    
-            lessons.append(f"{start.strftime('%H:%M')} - {end.strftime('%H:%M')}: {subject} in {room}")
-            previous_end = end
-            
-        if not lessons:
-            # Falls keine Stunden vorhanden sind (z. B. ein ferienähnlicher Tag)
-            lessons.append("Heute ist schulfrei!!! :-)")
+    def to_json(self):
+        data = dataclasses.asdict(self)
+        data["start"], data["end"] = self.start.isoformat(), self.end.isoformat()
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**dict(data, start=datetime.fromisoformat(data["start"]), end=datetime.fromisoformat(data["end"])))
+
+def diff_lessons(previous, current):
+    """Keys of lessons that were added or changed between two fetches of the same day"""
+    before = {lesson.key: lesson for lesson in previous}
+    return {lesson.key for lesson in current if before.get(lesson.key) != lesson}
+
+class UntisClient:
+    """Keeps one WebUntis login alive and caches holidays and the timetable of the coming days"""
+    def __init__(self, timetable_ttl, days, cache_path, max_backoff):
+        self.session = None
+        self.logged_in = False
+        self.timetable_ttl = timetable_ttl
+        self.days = days
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.holidays_cache = None  # (date, holidays)
+        self.timetable_cache = self.load_timetable()  # (fetched datetime, {date: lessons})
+        self.changed = frozenset()  # Keys of lessons that changed since an earlier fetch
+        self.max_backoff = max_backoff
+        self.backoff = 0
+        self.retry_at = 0  # No fetch before this time.time() after a failure
+        self.fetch_error = None
+
+    def call(self, method, **kwargs):
+        """Calls a session method, logging in again once if the session expired"""
+        if self.session is None:
+            import webuntis
+
+            # Zugangsdaten und Schul-Info
+            self.session = webuntis.Session(
+                username="metzjon",
+                password=os.getenv("WEBUNTIS_PASSWORD"),  # Passwort aus Umgebungsvariablen
+                school="bg-brg-keimgasse",
+                useragent='WebUntisPython',
+                server="https://neilo.webuntis.com"  # WebUntis-URL deiner Schule
+            )
+        if not self.logged_in:
+            with tracer.span("webuntis_login"):
+                self.session.login()
+            self.logged_in = True
+        try:
+            with tracer.span(f"webuntis_{method}"):
+                return getattr(self.session, method)(**kwargs)
+        except Exception as e:
+            logging.info(f"WebUntis call failed ({e}) - logging in again")
+            self.session.logout(suppress_errors=True)
+            with tracer.span("webuntis_login", retry=True):
+                self.session.login()
+            with tracer.span(f"webuntis_{method}", retry=True):
+                return getattr(self.session, method)(**kwargs)
+
+    def logout(self):
+        with self.lock:
+            if self.logged_in:
+                self.session.logout(suppress_errors=True)
+                self.logged_in = False
+
+    def holidays(self):
+        """Holidays are fetched at most once per day"""
+        with self.lock:
+            today = datetime.now().date()
+            if not self.holidays_cache or self.holidays_cache[0] != today:
+                self.holidays_cache = (today, list(self.call("holidays")))
+            return self.holidays_cache[1]
+
+    def load_timetable(self):
+        """Timetable store of the last run, None if there is none"""
+        try:
+            with open(self.cache_path, encoding='utf-8') as file:
+                data = json.load(file)
+            days = {
+                datetime.fromisoformat(day).date(): tuple(Lesson.from_json(lesson) for lesson in lessons)
+                for day, lessons in data["days"].items()
+            }
+            return datetime.fromisoformat(data["fetched"]), days
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+    def save_timetable(self):
+        fetched, days = self.timetable_cache
+        data = {
+            "fetched": fetched.isoformat(),
+            "days": {day.isoformat(): [lesson.to_json() for lesson in lessons] for day, lessons in days.items()},
+        }
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path, "w", encoding='utf-8') as file:
+            json.dump(data, file)
+
+    def fetch_days(self, first_day):
+        """Fetches self.days days in one my_timetable call, returns {date: lessons} with every day present"""
+        last_day = first_day + timedelta(days=self.days - 1)
+        days = {first_day + timedelta(days=i): [] for i in range(self.days)}
+        for period in self.call("my_timetable", start=first_day, end=last_day):
+            lesson = Lesson.from_period(period)
+            days.setdefault(lesson.start.date(), []).append(lesson)
+        return {day: tuple(sorted(lessons, key=lambda lesson: lesson.start)) for day, lessons in days.items()}
+
+    def timetable(self, day=None):
+        """Lessons of day (default today) from the store, refetched after the TTL and at every lesson start or end today.
+
+        If the refetch fails the stored week is served and fetching pauses
+        with a growing backoff; a day the store does not cover raises, so the
+        caller keeps what it showed before.
+        """
+        with self.lock:
+            now = datetime.now()
+            day = day or now.date()
+            previous = {}
+            if self.timetable_cache:
+                fetched, days = self.timetable_cache
+                today = days.get(now.date(), ())
+                boundary_passed = any(fetched < t <= now for lesson in today for t in (lesson.start, lesson.end))
+                if (day in days and now.date() in days and not boundary_passed
+                        and (now - fetched).total_seconds() < self.timetable_ttl):
+                    return days[day]
+                previous = days
+
+            if time.time() < self.retry_at:
+                if day in previous:
+                    return previous[day]
+                raise self.fetch_error
+            try:
+                days = self.fetch_days(now.date())
+            except Exception as e:
+                self.backoff = min(max(self.backoff * 2, 60), self.max_backoff)
+                self.retry_at = time.time() + self.backoff
+                self.fetch_error = e
+                if day not in previous:
+                    raise
+                logging.warning(f"Timetable fetch failed, using the stored week for {self.backoff}s: {e}")
+                return previous[day]
+            self.backoff = self.retry_at = 0
+            common = [day for day in days if day in previous]
+            old = [lesson for day in common for lesson in previous[day]]
+            new = [lesson for day in common for lesson in days[day]]
+            changes = diff_lessons(old, new) if old != new else set()
+            if changes:
+                logging.info(f"Timetable changed: {len(changes)} lesson(s)")
+            current = {lesson.key for lessons in days.values() for lesson in lessons}
+            self.changed = frozenset((self.changed | changes) & current)
+            self.timetable_cache = (now, days)
+            self.save_timetable()
+            return days.get(day, ())
+
+    def invalidate(self):
+        """Makes the next timetable() call fetch again"""
+        with self.lock:
+            self.backoff = self.retry_at = 0
+            if self.timetable_cache:
+                self.timetable_cache = (datetime.min, self.timetable_cache[1])
+
+    def next_school_day(self, after):
+        """(date, lessons) of the first day after after with lessons that take place, None if unknown"""
+        with self.lock:
+            if not self.timetable_cache:
+                return None
+            for day, lessons in sorted(self.timetable_cache[1].items()):
+                if day > after and any(not lesson.cancelled for lesson in lessons):
+                    return day, lessons
+        return None
+
+untis = UntisClient(TIMETABLE_TTL, TIMETABLE_DAYS, TIMETABLE_CACHE_PATH, TIMETABLE_MAX_BACKOFF)
+atexit.register(untis.logout)
+
+def lesson_text(lesson):
+    """One timetable row, e.g. 08:00 - 08:50: M in 1A (Vertretung: Huber)"""
+    text = f"{lesson.start.strftime('%H:%M')} - {lesson.end.strftime('%H:%M')}: {lesson.subject}"
+    if lesson.cancelled:
+        return f"{text} entfällt"
+    text += f" in {lesson.room}"
+    if lesson.original_room:
+        text += f" (statt {lesson.original_room})"
+    if lesson.substitution:
+        text += f" (Vertretung: {lesson.teacher})" if lesson.teacher else " (Vertretung)"
+    if lesson.subst_text:
+        text += f" [{lesson.subst_text}]"
+    return text
+
+@functools.lru_cache(maxsize=4)
+def format_lessons(lessons, changed, day, title=None):
+    """Timetable rows (text, style) for the panel, style is "normal", "changed" or "cancelled".
+
+    Cached, so polling an unchanged timetable neither re-formats nor re-renders.
+    """
+    rows = [(title, "normal")] if title else []
+    # Anfang des Schultages
+    previous_end = datetime.combine(day, datetime.strptime("08:00", "%H:%M").time())
+    for lesson in lessons:
+        if lesson.cancelled:
+            rows.append((lesson_text(lesson), "changed" if lesson.key in changed else "cancelled"))
+            continue
+
+        # Freistunde vor dieser Stunde?
+        if (lesson.start - previous_end).total_seconds() > 15 * 60:
+            rows.append((f"{previous_end.strftime('%H:%M')} - {lesson.start.strftime('%H:%M')}: FREI!!!", "normal"))
+
+        rows.append((lesson_text(lesson), "changed" if lesson.key in changed else "normal"))
+        previous_end = lesson.end
+
+    if not lessons:
+        # Falls keine Stunden vorhanden sind (z. B. ein ferienähnlicher Tag)
+        rows.append(("Heute ist schulfrei!!! :-)", "normal"))
+    return tuple(rows)
+
+def day_lessons():
+    """Today's lesson rows, or those of the next school day once today's lessons are over"""
+    now = datetime.now()
+    today = untis.timetable()
+    taking_place = [lesson for lesson in today if not lesson.cancelled]
+    if taking_place and now < max(lesson.end for lesson in taking_place):
+        return format_lessons(today, untis.changed, now.date())
+
+    untis.timetable(now.date() + timedelta(days=1))  # Refreshes the store if it is stale
+    next_day = untis.next_school_day(now.date())
+    if next_day is None:
+        return format_lessons(today, untis.changed, now.date())
+    day, lessons = next_day
+    when = "Morgen" if day == now.date() + timedelta(days=1) else "Nächster Schultag"
+    title = f"{when} ({WEEKDAYS[day.weekday()]}, {day.strftime('%d.%m.')}):"
+    return format_lessons(lessons, untis.changed, day, title)
+
+def time_table():
+    """Fetches the timetable"""
+    try:
+        lessons = day_lessons()
         
+        all_holidays = untis.holidays()
         holidays = [
             f"{h.name}: {h.start.strftime('%d.%m.%Y')}" if h.start.date() == h.end.date()
             else f"{h.name}: {h.start.strftime('%d.%m.%Y')} - {h.end.strftime('%d.%m.%Y')}"
-            for h in sorted(session.holidays(), key=lambda x: x.start)
+            for h in sorted(all_holidays, key=lambda x: x.start)
             if h.end.date() > datetime.now().date()
         ]
         
-        future_holidays = [h for h in session.holidays() if h.end.date() >= datetime.now().date()]
+        future_holidays = [h for h in all_holidays if h.end.date() >= datetime.now().date()]
         if future_holidays:
             next_holiday = sorted(future_holidays, key=lambda x: x.start)[0]
             days_until = (next_holiday.start.date() - datetime.now().date()).days
             
-        # Get weather data explicitly before building the holidays_info list
-        logging.info("Fetching weather data...")
-        logging.info("Weather data fetched")
-
         holidays_info = ["Nächsten 10 Ferien/Feiertage:\n"]
         for i, holiday in enumerate(holidays):
             if i < 10:
@@ -356,160 +1168,1360 @@ def time_table(weather_data):
         
         next_holiday_text = f'\n{next_holiday.name}: Wie gesagt, es ist gerade frei!\n(Ja, man muss das zweimal sagen ;) )' if next_holiday.start.date() <= datetime.now().date() <= next_holiday.end.date() else f'{next_holiday.start.strftime("%d.%m.%Y")}\nIn {days_until} Tag(en)'
         
-        holidays_info.append(f"\nNächste(r) Ferien/Feiertag: {next_holiday_text}\n\nWetter an deinem (nicht wirklich genauen) Standort:\n{weather_data}")
-
-        # Session beenden
-        session.logout()
+        holidays_info.append(f"\nNächste(r) Ferien/Feiertag: {next_holiday_text}")
         return lessons, holidays_info
 
     except Exception as e:
         logging.error(f"Error fetching timetable: {str(e)}")
-        return []
+        return None
+
+# --------------------------
+# PANEL RENDERING
+# --------------------------
+# Layout settings (Pixel bei LAYOUT_REFERENCE, für andere Auflösungen wird skaliert)
+LAYOUT_REFERENCE = (1920, 1080)
+LINE_SPACING = 37
+TODO_LINE_SPACING = 32
+TODO_X_OFFSET = 850  # Abstand vom linken Rand
+TODO_RIGHT_MARGIN = 50  # Abstand vom rechten Rand, danach wird umgebrochen
+TIMETABLE_X_OFFSET = 850  # Stundenplan (links oben)
+TIMETABLE_H_START = 50
+HOLIDAYS_X_OFFSET = 50  # Ferien (oben rechts)
+HOLIDAYS_H_START = 50
+TIMETABLE_COLORS = {"normal": (255, 255, 255), "changed": (255, 200, 40), "cancelled": (150, 150, 150)}
+BACKDROP_PADDING = 24  # Abgedunkelter Bereich ragt so weit über den Text hinaus
+BACKDROP_GRID = 64  # Backdrop-Rechteck wird auf dieses Raster gerundet, damit der Cache trifft
+BACKDROP_TARGET_LUMINANCE = 100  # Hellere Stellen hinter dem Text werden bis hierhin abgedunkelt
+BACKDROP_BLUR = 6
+SHADOW_OFFSET = 2
+SHADOW_BLUR = 2
+SHADOW_OPACITY = 0.8
+
+class Layout:
+    """Panel anchors and text metrics for one display size, scaled from LAYOUT_REFERENCE"""
+    def __init__(self, size):
+        width, height = size
+        scale_x = width / LAYOUT_REFERENCE[0]
+        scale = height / LAYOUT_REFERENCE[1]  # Text wächst mit der Bildschirmhöhe
+        self.size = size
+        self.scale = scale
+        self.font_size = round(FONT_SIZE * scale)
+        self.line_spacing = round(LINE_SPACING * scale)
+        self.holiday_spacing = round((LINE_SPACING + 20) * scale)
+        self.todo_line_spacing = round(TODO_LINE_SPACING * scale)
+        self.indent_width = 40 * scale
+        self.strike_y = round(15 * scale)
+        self.todo_right_margin = round(TODO_RIGHT_MARGIN * scale_x)
+        self.timetable_origin = (round(TIMETABLE_X_OFFSET * scale_x), round(TIMETABLE_H_START * scale))
+        self.holidays_origin = (round(HOLIDAYS_X_OFFSET * scale_x), round(HOLIDAYS_H_START * scale))
+        self.todo_x = round(TODO_X_OFFSET * scale_x)
+        self.backdrop_padding = round(BACKDROP_PADDING * scale)
+        self.backdrop_grid = max(round(BACKDROP_GRID * scale), 1)
+        self.backdrop_blur = BACKDROP_BLUR * scale
+        self.shadow_offset = max(round(SHADOW_OFFSET * scale), 1)
+        self.shadow_blur = SHADOW_BLUR * scale
+
+    def todo_origin(self, lesson_count):
+        """Todos start at 2/5 of the screen or below the timetable, whichever is lower"""
+        last_timetable_y = self.timetable_origin[1] + lesson_count * self.line_spacing
+        return self.todo_x, max(2 * (self.size[1] // 5), last_timetable_y + round(13 * self.scale))
+
+    def backdrop_rect(self, rect):
+        """Padded panel rect snapped outwards to the backdrop grid and clipped to the screen"""
+        if not rect:
+            return None
+        grid, pad = self.backdrop_grid, self.backdrop_padding
+        left = max((rect[0] - pad) // grid * grid, 0)
+        top = max((rect[1] - pad) // grid * grid, 0)
+        right = min(-(-(rect[2] + pad) // grid) * grid, self.size[0])
+        bottom = min(-(-(rect[3] + pad) // grid) * grid, self.size[1])
+        return left, top, right, bottom
+
+@functools.lru_cache(maxsize=16)
+def layout_for(size):
+    return Layout(size)
 
-def create_wallpaper_image(todos, timetable, background_path=BACKGROUND_PATH):
-    """Creates the wallpaper image with todos on the left and timetable on the right."""
+def draw_timetable(layer, fnt, lessons, layout):
+    """Draws the lessons of the day onto a panel layer, changes highlighted"""
+    draw = ImageDraw.Draw(layer)
+    for i, lesson in enumerate(lessons):
+        text, style = (lesson, "normal") if isinstance(lesson, str) else lesson
+        draw.text((0, i * layout.line_spacing), text, font=fnt, fill=TIMETABLE_COLORS[style])
+
+@functools.lru_cache(maxsize=2048)
+def todo_row_sprite(row, fnt, strike_y):
+    """Renders one to-do row once; unchanged rows are only pasted again"""
+    prefix, text, checked, indent, strike = row
+    line = f"{prefix} {text}"
+    left, top, right, bottom = text_bbox(line, fnt)
+    width = max(right, text_length(line, fnt)) + 1
+    sprite = Image.new('RGBA', (math.ceil(width), max(math.ceil(bottom), strike_y + 2)))
+    draw = ImageDraw.Draw(sprite)
+
+    color = (180, 180, 180) if checked else (255, 255, 255)
+    draw.text((0, 0), line, font=fnt, fill=color, embedded_color=True)
+
+    if strike:
+        text_width = text_length(line, fnt)
+        draw.line((0, strike_y, text_width, strike_y), fill=color, width=2)
+    return sprite
+
+def grapheme_ends(text):
+    """Offsets after each grapheme cluster (combining marks, emoji sequences and flags stay together)"""
+    ends = []
+    i, n = 0, len(text)
+    while i < n:
+        first = ord(text[i])
+        i += 1
+        if 0x1F1E6 <= first <= 0x1F1FF and i < n and 0x1F1E6 <= ord(text[i]) <= 0x1F1FF:
+            i += 1  # Regional indicator pair (flag)
+        while i < n:
+            c = ord(text[i])
+            if (unicodedata.category(text[i]) in ("Mn", "Me", "Mc") or c in (0xFE0E, 0xFE0F)
+                    or 0x1F3FB <= c <= 0x1F3FF or 0xE0020 <= c <= 0xE007F):
+                i += 1  # Combining mark, variation selector, skin tone or tag
+            elif c == 0x200D and i + 1 < n:
+                i += 2  # Zero width joiner plus the joined character
+            else:
+                break
+        ends.append(i)
+    return ends
+
+def fitting_length(fnt, lead, text, max_width):
+    """Number of characters of text that fit behind lead, found by binary search over grapheme clusters"""
+    ends = grapheme_ends(text)
+    low, high = 0, len(ends)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if fnt.getlength(lead + text[:ends[mid - 1]]) <= max_width:
+            low = mid
+        else:
+            high = mid - 1
+    return ends[max(low, 1) - 1]  # At least one cluster per row
+
+@functools.lru_cache(maxsize=4096)
+def wrap_row(row, fnt, max_width, indent_width):
+    """Splits a to-do row into as many rows as it needs to fit max_width pixels"""
+    prefix, text, checked, indent, strike = row
+    rows = []
+    while True:
+        width = max_width - indent * indent_width
+        if not text or width <= 0 or text_length(f"{prefix} {text}", fnt) <= width:
+            break  # The rest fits, or deep indents leave no room and it becomes one clipped row
+        cut = fitting_length(fnt, f"{prefix} ", text, width)
+        space = text.rfind(" ", 1, cut + 1)
+        if space > 0:
+            cut = space  # Break between words where possible
+        rows.append((prefix, text[:cut], checked, indent, strike))
+        prefix, text, indent = "", text[cut:], row[3] + 0.25
+    rows.append((prefix, text, checked, indent, strike))
+    return rows
+
+def wrap_todos(todos, fnt, layer_size, layout):
+    """The wrapped rows of the to-do list that fit on a panel layer of layer_size"""
+    max_width = layer_size[0] - layout.todo_right_margin
+    visible_rows = layer_size[1] // layout.todo_line_spacing + 1
+    rows = []
+    for row in todos:
+        if len(rows) >= visible_rows:
+            break  # Rows below the screen edge are neither wrapped nor drawn
+        rows.extend(wrap_row(row, fnt, max_width, layout.indent_width))
+    return rows[:visible_rows]
+
+def draw_todos(layer, fnt, todos, layout):
+    """Draws the to-do list onto a panel layer"""
+    for i, row in enumerate(wrap_todos(todos, fnt, layer.size, layout)):
+        y = i * layout.todo_line_spacing
+        x = int(row[3] * layout.indent_width)
+        if x < layer.width:
+            layer.alpha_composite(todo_row_sprite(row, fnt, layout.strike_y), dest=(x, y))
+
+def draw_holidays(layer, fnt, holidays, layout):
+    """Draws the holidays and weather info onto a panel layer"""
+    draw = ImageDraw.Draw(layer)
+    for i, holiday in enumerate(holidays):
+        draw.text((0, i * layout.holiday_spacing), holiday, font=fnt, fill=(255, 255, 255))
+
+# --------------------------
+# LEGIBILITY EFFECTS
+# --------------------------
+def add_shadow(layer, layout):
+    """Puts a soft drop shadow under the text of a cropped panel layer.
+
+    Returns the new layer and how far it grew to the left and top.
+    """
+    offset, blur = layout.shadow_offset, layout.shadow_blur
+    spread = math.ceil(blur * 2)
+    grow = max(spread - offset, 0)
+    width, height = layer.size
+    shadowed = Image.new('RGBA', (width + grow + offset + spread, height + grow + offset + spread))
+    alpha = Image.new('L', shadowed.size)
+    alpha.paste(layer.getchannel('A'), (grow + offset, grow + offset))
+    alpha = alpha.filter(ImageFilter.GaussianBlur(blur)).point(lambda a: int(a * SHADOW_OPACITY))
+    shadowed.putalpha(alpha)  # Schwarz mit weichem Alpha
+    shadowed.alpha_composite(layer, dest=(grow, grow))
+    return shadowed, grow
+
+@functools.cache
+def optional_numpy():
+    """NumPy if it is installed, otherwise None (logged once)"""
     try:
-        image = Image.open(background_path) 
-        #print(f"Background image mode: {image.mode}, size: {image.size}")
-        
-        # Convert to RGBA if not already
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-            #print(f"Converted image to RGBA mode from {image.mode}")
-    except FileNotFoundError:
-        logging.error(f"Background image not found: {background_path}")
+        import numpy
+        return numpy
+    except ImportError:
+        logging.warning("NumPy is not installed - backdrops are dimmed with the Pillow fallback")
         return None
 
-    fnt = load_font()
-    draw = ImageDraw.Draw(image)
-    width, height = image.size
+def dim_pixels(region, luminance):
+    """Scales every pixel of region by min(1, BACKDROP_TARGET_LUMINANCE / luminance)"""
+    np = optional_numpy()
+    if np is None:
+        factor = luminance.point([min(255, round(255 * BACKDROP_TARGET_LUMINANCE / max(l, 1))) for l in range(256)])
+        return ImageChops.multiply(region, Image.merge('RGB', (factor, factor, factor)))
+    factor = np.minimum(1.0, BACKDROP_TARGET_LUMINANCE / np.maximum(np.asarray(luminance, dtype=np.float32), 1.0))
+    pixels = np.asarray(region, dtype=np.float32) * factor[..., None]
+    return Image.fromarray(pixels.astype(np.uint8), 'RGB')
 
-    # Layout settings
-    line_spacing = 37
-    todo_line_spacing = 32
+def make_backdrop(background, rect, layout):
+    """Dimmed (and optionally blurred) copy of the background behind a panel, with feathered edges.
 
-    # Positioning for Todos
-    todo_x_offset = 850  # Abstand vom linken Rand
+    Pixels are darkened in proportion to the local luminance around them, so
+    dark photo areas stay untouched and bright ones are brought down to
+    BACKDROP_TARGET_LUMINANCE.
+    """
+    region = background.crop(rect).convert('RGB')
+    if "blur" in EFFECTS:
+        region = region.filter(ImageFilter.GaussianBlur(layout.backdrop_blur))
 
-    # Positioning for Timetable (links oben)
-    timetable_x_offset = 850
-    timetable_h_start = 50
+    luminance = region.convert('L').filter(ImageFilter.BoxBlur(layout.backdrop_padding))
+    backdrop = dim_pixels(region, luminance).convert('RGBA')
 
-    # Positioning for holidays (oben rechts)
-    holidays_x_offset = 50  # Abstand vom rechten Rand
-    holidays_h_start = 50
+    feather = layout.backdrop_padding // 2
+    mask = Image.new('L', region.size)
+    ImageDraw.Draw(mask).rectangle((feather, feather, region.width - feather, region.height - feather), fill=255)
+    backdrop.putalpha(mask.filter(ImageFilter.GaussianBlur(feather / 2)))
+    return backdrop
 
-    # Render Timetable
-    for i, lesson in enumerate(timetable[0]):
-        y = timetable_h_start + i * line_spacing
-        x = timetable_x_offset
+class BackdropCache:
+    """Keeps the backdrops of the current background per panel rect"""
+    def __init__(self, max_entries=32):
+        self.background = None
+        self.max_entries = max_entries
+        self.entries = {}
 
-        color = (255, 255, 255)
-        draw.text((x, y), lesson, font=fnt, fill=color)
+    def get(self, background, rect, layout):
+        if background is not self.background:
+            self.background = background
+            self.entries = {}
+        if rect not in self.entries:
+            if len(self.entries) >= self.max_entries:
+                del self.entries[next(iter(self.entries))]  # Ältester Eintrag
+            self.entries[rect] = make_backdrop(background, rect, layout)
+        return self.entries[rect]
 
-    # Dynamischer Abstand nach dem Stundenplan
-    last_timetable_y = timetable_h_start + len(timetable[0]) * line_spacing
-    
-    # Calculate the 1/3 position of the screen for todos
-    two_fifth_of_the_screen= 2* (height // 5)  
-    
-    # Position todos at 1/3 of screen or below timetable with 50px gap, whichever is lower
-    todo_h_start = max(two_fifth_of_the_screen, last_timetable_y + 13)
-
-    # Render Todos
-    line_count = 0
-    for i, (prefix, text, checked, indent, strike) in enumerate(todos):
-        y = todo_h_start + line_count * todo_line_spacing
-        x = todo_x_offset + indent * 40
-        
-        color = (180, 180, 180) if checked else (255, 255, 255)
-        draw.text((x, y), f"{prefix} {text}", font=fnt, fill=color, embedded_color=True)
-        
-        if strike:
-            text_width = draw.textlength(f"{prefix} {text}", font=fnt)
-            draw.line((x, y+15, x+text_width, y+15), fill=color, width=2)
-        
-        line_count += 1
+def data_hash(data):
+    """Returns a stable hash of the given panel input"""
+    return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()
 
-    # Render Holidays
-    for i, holiday in enumerate(timetable[1]):
-        y = holidays_h_start + i * (line_spacing+20)
-        x = holidays_x_offset
-        
-        color = (255, 255, 255)
-        draw.text((x, y), holiday, font=fnt, fill=color)
+def intersect(a, b):
+    """Returns the overlap of two (left, top, right, bottom) boxes or None"""
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+class Panel:
+    """One cached, transparent layer of the wallpaper"""
+    def __init__(self, name, draw_func, font="text"):
+        self.name = name
+        self.draw_func = draw_func
+        self.font = font
+        self.key = None
+        self.layer = None
+        self.rect = None  # (left, top, right, bottom) on the wallpaper
+
+    def render(self, key, layout, origin, data, fnt):
+        """Redraws the layer and returns the boxes that have to be repainted"""
+        width, height = layout.size
+        x0, y0 = origin
+        layer = Image.new('RGBA', (max(width - x0, 1), max(height - y0, 1)))
+        self.draw_func(layer, fnt, data, layout)
+
+        dirty = [self.rect] if self.rect else []
+        bbox = layer.getbbox()
+        if bbox:
+            self.layer = layer.crop(bbox)
+            x0, y0 = x0 + bbox[0], y0 + bbox[1]
+            if "shadow" in EFFECTS:
+                self.layer, grow = add_shadow(self.layer, layout)
+                x0, y0 = x0 - grow, y0 - grow
+            self.rect = (x0, y0, x0 + self.layer.width, y0 + self.layer.height)
+            dirty.append(self.rect)
+        else:
+            self.layer = self.rect = None
+
+        self.key = key
+        return dirty
+
+def get_display_size():
+    """Returns the primary display resolution, or None to keep the background's own size"""
+    configured = os.getenv("WALLPAPER_SIZE")  # z. B. "3840x2160"
+    if configured:
+        width, height = configured.lower().split("x")
+        return int(width), int(height)
+
+    return wallpaper_backend.display_size()
+
+def get_monitors():
+    """Returns (left, top, width, height) of every monitor, an empty list if unknown"""
+    configured = os.getenv("WALLPAPER_MONITORS")  # z. B. "1920x1080+0+0,2560x1440+1920-180"
+    if configured:
+        monitors = []
+        for part in configured.split(","):
+            width, height, left, top = re.fullmatch(r"\s*(\d+)x(\d+)([+-]\d+)([+-]\d+)\s*", part.lower()).groups()
+            monitors.append((int(left), int(top), int(width), int(height)))
+        return monitors
+
+    try:
+        return wallpaper_backend.monitors()
+    except Exception as e:
+        logging.error(f"Could not list monitors: {str(e)}")
+        return []
+
+class BackgroundCache:
+    """Decodes the background once and keeps one scaled copy per display size"""
+    def __init__(self):
+        self.key = None
+        self.source = None
+        self.scaled = {}
+
+    def get(self, path, size=None):
+        """Returns the RGBA background filling size, raises FileNotFoundError if missing"""
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        if key != self.key:
+            image = Image.open(path)
+            # Convert to RGBA if not already
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+            self.source = image
+            self.scaled = {}
+            self.key = key
+
+        if not size or size == self.source.size:
+            return self.source
+        if size not in self.scaled:
+            logging.info(f"Scaling background from {self.source.size} to {size}")
+            self.scaled[size] = ImageOps.fit(self.source, size, Image.LANCZOS)
+        return self.scaled[size]
+
+backgrounds = BackgroundCache()
+
+class WallpaperRenderer:
+    """Keeps the decoded background and every panel cached between updates"""
+    def __init__(self):
+        self.background = None
+        self.frame = None
+        self.dirty_regions = 0
+        self.backdrops = BackdropCache()
+        self.panels = [
+            Panel("timetable", draw_timetable),
+            Panel("todos", draw_todos, font="emoji"),
+            Panel("holidays", draw_holidays),
+        ]
+
+    def load_background(self, background_path, size):
+        """Picks the cached background for size, returns False if it is missing"""
+        try:
+            background = backgrounds.get(background_path, size)
+        except FileNotFoundError:
+            logging.error(f"Background image not found: {background_path}")
+            return False
+
+        if background is not self.background:
+            self.background = background
+            self.frame = None
+        return True
+
+    def repaint(self, box):
+        """Restores the background inside box and composites all backdrops and panels over it"""
+        self.frame.paste(self.background.crop(box), box[:2])
+        layout = layout_for(self.frame.size)
+        for panel in self.panels:
+            rect = layout.backdrop_rect(panel.rect) if EFFECTS & {"dim", "blur"} else None
+            overlap = rect and intersect(box, rect)
+            if overlap:
+                backdrop = self.backdrops.get(self.background, rect, layout)
+                source = (overlap[0] - rect[0], overlap[1] - rect[1], overlap[2] - rect[0], overlap[3] - rect[1])
+                self.frame.alpha_composite(backdrop, dest=overlap[:2], source=source)
+        for panel in self.panels:
+            if not panel.layer:
+                continue
+            overlap = intersect(box, panel.rect)
+            if overlap:
+                left, top = panel.rect[:2]
+                source = (overlap[0] - left, overlap[1] - top, overlap[2] - left, overlap[3] - top)
+                self.frame.alpha_composite(panel.layer, dest=overlap[:2], source=source)
+
+    def render(self, todos, timetable, background_path, size=None):
+        if not self.load_background(background_path, size):
+            return None
+
+        full_redraw = self.frame is None
+        if full_redraw:
+            self.frame = self.background.copy()
+            for panel in self.panels:
+                panel.key = panel.layer = panel.rect = None
+
+        lessons, holidays = timetable if timetable else ([], [])
+        size = self.frame.size
+        layout = layout_for(size)
 
+        inputs = [
+            (layout.timetable_origin, lessons),
+            (layout.todo_origin(len(lessons)), todos),
+            (layout.holidays_origin, holidays),
+        ]
+
+        dirty = []
+        for panel, (origin, data) in zip(self.panels, inputs):
+            key = data_hash((origin, size, data))
+            if key == panel.key:
+                continue
+            old_rect = panel.rect
+            dirty.extend(panel.render(key, layout, origin, data, load_font(panel.font, layout.font_size)))
+            if EFFECTS & {"dim", "blur"}:
+                dirty.extend(filter(None, (layout.backdrop_rect(old_rect), layout.backdrop_rect(panel.rect))))
+
+        if full_redraw:
+            self.repaint((0, 0) + size)
+        else:
+            for box in dirty:
+                self.repaint(box)
+        self.dirty_regions = len(dirty)
+        logging.info(f"Rendered wallpaper ({len(dirty)} dirty region(s))")
+        return self.frame
+
+renderer = WallpaperRenderer()
+
+def create_wallpaper_image(todos, timetable, background_path=BACKGROUND_PATH, size=None):
+    """Creates the wallpaper image with todos on the left and timetable on the right.
+
+    The background is scaled to size (default: the display resolution). Only
+    panels whose input changed since the last call are redrawn; the returned
+    image is owned by the renderer and must not be modified.
+    """
+    return renderer.render(todos, timetable, background_path, size or get_display_size())
+
+# --------------------------
+# RENDER WORKERS
+# --------------------------
+class LoggerDispatcher:
+    """Hands records coming from render processes to the logger they were created on"""
+    level = logging.NOTSET
+
+    def handle(self, record):
+        logging.getLogger(record.name).handle(record)
+
+@functools.lru_cache(maxsize=None)
+def render_log_queue():
+    """Queue the render processes log into, emptied by a listener thread of the main process"""
+    log_queue = multiprocessing.get_context("spawn").Queue()
+    listener = logging.handlers.QueueListener(log_queue, LoggerDispatcher())
+    listener.start()
+    atexit.register(listener.stop)
+    return log_queue
+
+def init_render_process(log_queue):
+    """Sends every log record and trace span of a render process to the main process"""
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+    tracer.logger.handlers = []  # Spans reach the main process once, through the root handler
+    tracer.logger.propagate = True
+
+def process_rss():
+    """Resident memory of this process in bytes, None if unknown"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class MemoryCounters(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                        "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+                    )
+                ]
+
+            counters = MemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.psapi.GetProcessMemoryInfo(
+                ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+            )
+            return counters.WorkingSetSize
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+def compose(variants, monitors):
+    """Pastes the variant of every monitor at its place on the virtual desktop"""
+    left = min(m[0] for m in monitors)
+    top = min(m[1] for m in monitors)
+    right = max(m[0] + m[2] for m in monitors)
+    bottom = max(m[1] + m[3] for m in monitors)
+    canvas = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 255))
+    images = {size: read_variant(variant) for size, variant in variants.items()}
+    for x, y, width, height in monitors:
+        canvas.paste(images[(width, height)], (x - left, y - top))
+    logging.info(f"Composed wallpaper for {len(monitors)} monitors from {len(images)} variant(s)")
+    return canvas
+
+def write_variant(image):
+    """Hands a rendered variant to another render process through a temp file, returns (mode, size, path)"""
+    fd, path = tempfile.mkstemp(suffix=".rgba", prefix="variant-")
+    with os.fdopen(fd, "wb") as file:
+        file.write(image.tobytes())
+    return image.mode, image.size, path
+
+def read_variant(variant):
+    """Loads and deletes a variant written by write_variant()"""
+    mode, size, path = variant
+    with open(path, "rb") as file:
+        image = Image.frombytes(mode, size, file.read())
+    os.remove(path)
     return image
 
+def discard_variant(future):
+    """Deletes the temp file of a finished render_variant() job if it is still there"""
+    if future.cancelled() or future.exception() is not None or not future.result():
+        return
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(future.result()["image"][2])
+
+def render_variant(job):
+    """Runs in a render process: renders one monitor size with the caches of that process"""
+    tracer.update_id = job["update_id"]
+    size = job["size"]
+    with profiled(job["profile"], f"render_{size[0]}x{size[1]}"), \
+            tracer.span("render_variant", size=f"{size[0]}x{size[1]}") as span:
+        image = create_wallpaper_image(job["todos"], job["timetable"], job["background_path"], size)
+        span["dirty_regions"] = renderer.dirty_regions
+    if image is None:
+        return None
+    return {"image": write_variant(image), "rss": process_rss()}
+
+def render_job(job):
+    """Renders (or composes) the wallpaper described by job and encodes it unless the pixels equal skip_hash.
+
+    Runs in a render worker, or in this process when RENDER_WORKER is off.
+    Returns {"path", "pixel_hash", "rss"} with path None if nothing was
+    written, or None if the wallpaper could not be rendered.
+    """
+    tracer.update_id = job["update_id"]
+    with profiled(job["profile"], "render"):
+        if "variants" in job:
+            image = compose(job["variants"], job["monitors"])
+        else:
+            with tracer.span("render") as span:
+                image = create_wallpaper_image(job["todos"], job["timetable"], job["background_path"], job["size"])
+                span["dirty_regions"] = renderer.dirty_regions
+        if image is None:
+            return None
+
+        result = {"path": None, "pixel_hash": hashlib.sha1(image.tobytes()).hexdigest(), "rss": None}
+        if result["pixel_hash"] != job["skip_hash"]:
+            with tracer.span("encode", format=job["output_format"]) as span:
+                save_image(image, job["output_path"], job["output_format"])
+                span["bytes"] = os.path.getsize(job["output_path"])
+            result["path"] = job["output_path"]
+    result["rss"] = process_rss()
+    return result
+
+class RenderWorker:
+    """One long-lived render process, replaced after max_renders jobs or once it uses more than max_rss"""
+    def __init__(self, name, max_renders, max_rss):
+        self.name = name
+        self.max_renders = max_renders
+        self.max_rss = max_rss
+        self.pool = None
+        self.renders = 0
+
+    def submit(self, func, *args):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),  # Forking a process with threads is unsafe
+                initializer=init_render_process,
+                initargs=(render_log_queue(),),
+            )
+            self.renders = 0
+        self.renders += 1
+        return self.pool.submit(func, *args)
+
+    def result(self, future):
+        """Waits for a job and recycles the process if it is worn out, died or hangs"""
+        try:
+            result = future.result(timeout=RENDER_TIMEOUT)
+        except BrokenProcessPool:
+            logging.error(f"Render worker {self.name} died - starting a new one")
+            self.shutdown()
+            raise
+        except TimeoutError:
+            logging.error(f"Render worker {self.name} hangs after {RENDER_TIMEOUT}s - starting a new one")
+            self.shutdown(kill=True)
+            raise
+        rss = result and result.get("rss")
+        if self.renders >= self.max_renders or (rss and rss > self.max_rss):
+            rss_text = f"{rss // 2**20} MiB" if rss else "unknown"
+            logging.info(f"Recycling render worker {self.name} after {self.renders} render(s), RSS {rss_text}")
+            self.shutdown()
+        return result
+
+    def shutdown(self, kill=False):
+        if self.pool is not None:
+            if kill:  # shutdown() alone waits for the running job to finish
+                for process in list(self.pool._processes.values()):
+                    process.kill()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+class RenderPool:
+    """Render workers, one per output size so each keeps its background, panels and glyph sprites cached.
+
+    With several monitors every distinct size is rendered in parallel and the
+    worker of the first monitor composes the virtual desktop and encodes it.
+    The variants travel between the workers as temp files, so the main process
+    only sends the gathered data and gets back paths, never pixels.
+    """
+    def __init__(self, max_renders, max_rss):
+        self.max_renders = max_renders
+        self.max_rss = max_rss
+        self.workers = {}
+
+    def worker(self, size):
+        if size not in self.workers:
+            self.workers[size] = RenderWorker(size, self.max_renders, self.max_rss)
+        return self.workers[size]
+
+    def warm_up(self, size):
+        """Starts the worker for size ahead of the first render"""
+        self.worker(size).submit(process_rss)
+
+    def render(self, job, monitors):
+        if len(monitors) <= 1:
+            worker = self.worker(job["size"])
+            return worker.result(worker.submit(render_job, job))
+
+        sizes = list(dict.fromkeys((width, height) for _, _, width, height in monitors))
+        for size in list(self.workers):
+            if size not in sizes:  # Monitor wurde abgesteckt
+                self.workers.pop(size).shutdown()
+        futures = [(size, self.worker(size).submit(render_variant, dict(job, size=size))) for size in sizes]
+        variants = {}
+        try:
+            for size, future in futures:
+                variant = self.workers[size].result(future)
+                if variant is None:
+                    return None
+                variants[size] = variant["image"]
+
+            worker = self.worker(sizes[0])
+            return worker.result(worker.submit(render_job, dict(job, variants=variants, monitors=monitors)))
+        finally:
+            for _, future in futures:  # Deletes the variants the composer did not get to, also late ones
+                future.add_done_callback(discard_variant)
+
+render_pool = RenderPool(RENDER_WORKER_MAX_RENDERS, RENDER_WORKER_MAX_RSS)
+
+# --------------------------
+# DATA GATHERING
+# --------------------------
+class DataGatherer:
+    """Fetches all data sources in parallel and keeps the last good result of each"""
+    def __init__(self, sources, timeouts, snapshot_path=None, persist=()):
+        self.sources = sources
+        self.timeouts = timeouts
+        self.snapshot_path = snapshot_path
+        self.persist = persist
+        self.executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="source")
+        self.pending = {}
+        self.results = self.load_snapshot()
+        self.lock = threading.Lock()
+
+    def load_snapshot(self):
+        """Results of the last run, so the first wallpaper does not wait for the network"""
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except (TypeError, FileNotFoundError, ValueError):
+            return {}
+        return {name: value for name, value in snapshot.items() if name in self.persist}
+
+    def save_snapshot(self):
+        snapshot = {name: self.results[name] for name in self.persist if name in self.results}
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        with open(self.snapshot_path, "w", encoding='utf-8') as file:
+            json.dump(snapshot, file)
+
+    def submit(self, name):
+        """Starts a fetch unless the previous one of this source is still running"""
+        with self.lock:
+            future = self.pending.get(name)
+            if future is not None:
+                return future
+            future = self.executor.submit(self.fetch, name)
+            self.pending[name] = future
+
+        # Outside the lock: the callback runs right away if the fetch already finished
+        future.add_done_callback(lambda f: self.store(name, f))
+        return future
+
+    def fetch(self, name):
+        with profiled(profile_run, f"source_{name}"), tracer.span(f"source_{name}"):
+            return self.sources[name]()
+
+    def store(self, name, future):
+        """Remembers the result of a finished fetch (None means it failed)"""
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Error fetching {name}: {e}")
+            result = None
+
+        with self.lock:
+            if self.pending.get(name) is future:
+                del self.pending[name]
+            if result is not None and result != self.results.get(name):
+                self.results[name] = result
+                if self.snapshot_path and name in self.persist:
+                    self.save_snapshot()
+
+    def gather(self, max_wait=None):
+        """Returns the freshest data of every source within its timeout (or max_wait)"""
+        futures = {name: self.submit(name) for name in self.sources}
+        started = time.monotonic()
+        for name, future in futures.items():
+            timeout = self.timeouts.get(name, 30) if max_wait is None else min(self.timeouts.get(name, 30), max_wait)
+            remaining = timeout - (time.monotonic() - started)
+            try:
+                future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                logging.warning(f"{name} is taking too long - using previous data")
+                continue
+            except Exception:
+                continue  # Already logged by store()
+            # The done callback may not have run yet
+            self.store(name, future)
+
+        with self.lock:
+            return dict(self.results)
+
+gatherer = DataGatherer(
+    {"todos": process_todos, "weather": get_weather_by_location, "timetable": time_table},
+    SOURCE_TIMEOUTS, SNAPSHOT_PATH, persist=("weather", "timetable")
+)
+
+def add_weather(timetable, weather_data):
+    """Appends the weather to the holidays panel"""
+    lessons, holidays = timetable if timetable else ([], [])
+    if weather_data is None:
+        return lessons, holidays
+
+    weather_text = f"Wetter an deinem (nicht wirklich genauen) Standort:\n{weather_data}"
+    if holidays:
+        return lessons, holidays[:-1] + [f"{holidays[-1]}\n\n{weather_text}"]
+    return lessons, [weather_text]
+
+def save_image(image, path, output_format=OUTPUT_FORMAT):
+    """Encodes image into a temporary file and swaps it in, so readers never see half a file"""
+    extension, mode, options = OUTPUT_FORMATS[output_format]
+    if image.mode != mode:
+        image = image.convert(mode)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=extension, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            image.save(file, **options)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+class AppliedWallpaper:
+    """Remembers the last applied wallpaper so identical updates can be skipped"""
+    def __init__(self):
+        self.fingerprint = None  # Hash of everything the image is rendered from
+        self.pixel_hash = None
+
+    def inputs_unchanged(self, fingerprint):
+        return fingerprint == self.fingerprint and os.path.exists(OUTPUT_IMAGE_PATH)
+
+    def skip_hash(self):
+        """Pixel hash a new render need not be encoded for, None once the file is gone"""
+        return self.pixel_hash if os.path.exists(OUTPUT_IMAGE_PATH) else None
+
+applied = AppliedWallpaper()
+
+def file_signature(path):
+    """Cheap change marker for a file: (path, mtime, size) or None if missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return path, stat.st_mtime, stat.st_size
+
 wallpaper_lock = threading.Lock()
 
-def wallpaper():
+def wallpaper(max_wait=None):
     """Main function to create the wallpaper"""
+    tracer.update_id += 1
+    with profile_if_requested(), tracer.span("update"):
+        update_wallpaper(max_wait)
+    tracer.write_summary(METRICS_SUMMARY_PATH)
 
-    #manage_log_file() # Ensure log file is not longer than 5000 lines
+def update_wallpaper(max_wait):
+    with tracer.span("gather"):
+        data = gatherer.gather(max_wait)
+    todos = data.get("todos", [])
+    timetable_data = data.get("timetable")
 
-    with wallpaper_lock:  # Use lock to prevent concurrent updates
-        now = datetime.now().strftime('%H:%M:%S')
-        todos = process_todos()
-        
+    if not todos and not timetable_data:
+        logging.warning("No todo items or timetable data to display")
+        return
+
+    timetable = add_weather(timetable_data, data.get("weather"))
+    monitors = get_monitors()
+    spanned = len(monitors) > 1
+    size = None if spanned else get_display_size()
+    fingerprint = data_hash((todos, timetable, file_signature(BACKGROUND_PATH), size, monitors))
+
+    with wallpaper_lock:  # Only composing and saving must not run concurrently
+        if applied.inputs_unchanged(fingerprint):
+            logging.info("Nothing changed - wallpaper left as it is")
+            return
+
+        job = {
+            "todos": todos,
+            "timetable": timetable,
+            "background_path": BACKGROUND_PATH,
+            "size": size,
+            "output_path": OUTPUT_IMAGE_PATH,
+            "output_format": OUTPUT_FORMAT,
+            "skip_hash": applied.skip_hash(),
+            "update_id": tracer.update_id,
+            # In this process the update profile already covers rendering
+            "profile": profile_run if RENDER_WORKER or spanned else None,
+        }
         try:
-            weather_data = get_weather_by_location(now)
-            timetable_data = time_table(weather_data)  # This now waits for weather data to complete
-            
-            if not todos and not timetable_data:
-                logging.warning("No todo items or timetable data to display")
+            with tracer.span("render_job", monitors=max(len(monitors), 1), worker=RENDER_WORKER or spanned):
+                if RENDER_WORKER or spanned:
+                    result = render_pool.render(job, monitors)
+                else:
+                    result = render_job(job)
+            if not result:
                 return
 
-            image = create_wallpaper_image(todos=todos, timetable=timetable_data)
-            if not image:
+            if result["path"] is None:
+                applied.fingerprint = fingerprint
+                logging.info("Rendered image is identical - wallpaper left as it is")
                 return
 
-            os.makedirs(OUTPUT_DIR, exist_ok=True)
-            image.save(OUTPUT_IMAGE_PATH)
-            time.sleep(1)
-            set_wallpaper(OUTPUT_IMAGE_PATH)
+            with tracer.span("set_wallpaper", backend=wallpaper_backend.name) as span:
+                span["ok"] = set_wallpaper(result["path"], spanned)
+            if not span["ok"]:
+                return  # Nothing recorded, so the next update applies it again
+            applied.fingerprint, applied.pixel_hash = fingerprint, result["pixel_hash"]
             logging.info("Wallpaper updated successfully with weather data")
         
         except Exception as e:
             logging.error(f"Error in wallpaper update: {str(e)}")
 
 # --------------------------
-# FILE MONITORING
+# UPDATE SCHEDULING
 # --------------------------
-class TodoFileHandler(FileSystemEventHandler):
-    def __init__(self):
-        self.last_modified = 0
+def upcoming_changes():
+    """Instants (datetime, reason) at which the wallpaper can go stale on its own"""
+    now = datetime.now()
+    changes = [(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()), "midnight")]
+    if untis.timetable_cache:
+        fetched, days = untis.timetable_cache
+        changes.extend(
+            (t, "lesson boundary") for lessons in days.values() for lesson in lessons for t in (lesson.start, lesson.end)
+        )
+        changes.append((fetched + timedelta(seconds=untis.timetable_ttl), "timetable expired"))
+    expiry = todo_document.next_expiry()
+    if expiry:
+        changes.append((expiry, "todo expired"))
+    weather_expiry = weather_cache.expires_at()
+    if weather_expiry:
+        changes.append((weather_expiry, "weather expired"))
+    return [(when, reason) for when, reason in changes if when > now]
 
-    def on_modified(self, event):
-        if not event.is_directory and os.path.abspath(event.src_path) == TODO_PATH:
-            current_time = time.time()
-            if current_time - self.last_modified > 2:  # Uncomment this
-                self.last_modified = current_time
-                logging.info("Change detected - updating wallpaper")
-                threading.Thread(target=wallpaper).start()  # Run in thread to avoid blocking
+class RefreshScheduler:
+    """Runs all wallpaper updates on one thread, debouncing and coalescing requests.
 
-def watch():
-    """Starts the file monitor"""
-    observer = Observer()
-    observer.schedule(TodoFileHandler(), path=APP_PATH, recursive=False)
-    observer.start()
-    logging.info(f"Watching file: {TODO_PATH}")
+    Between requests it sleeps until the earliest instant from upcoming, and
+    at the latest for interval seconds. Instants whose reason is in actions
+    run that action instead of an update (it requests one itself if needed).
+    """
+    def __init__(self, target, interval, debounce, max_delay, upcoming=None, actions=None):
+        self.target = target
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.upcoming = upcoming
+        self.actions = actions or {}
+        self.deadlines = []  # Min-heap of (datetime, reason)
+        self.condition = threading.Condition()
+        self.due = None  # When the pending update starts (time.monotonic)
+        self.first_request = None
+        self.reasons = set()
+        self.max_wait = None  # Shortest wait for data sources any queued request asked for
+        self.confirms = []  # Checks of conditional requests, run once the batch is due
+        self.unconditional = False  # Whether the batch also holds a request without a check
+        self.last_run = time.monotonic()
+
+    def request(self, reason, delay=None, max_wait=None, confirm=None):
+        """Queues an update; further requests within the debounce window push it back.
+
+        With confirm the request only counts if confirm() returns True when the
+        batch is due, i.e. after the debounce. It never delays a batch that
+        runs anyway, e.g. when the control API's own write of todo.md is seen.
+        """
+        with self.condition:
+            if confirm is not None and confirm not in self.confirms:
+                self.confirms.append(confirm)
+            if max_wait is not None:
+                self.max_wait = max_wait if self.max_wait is None else min(self.max_wait, max_wait)
+            self.reasons.add(reason)
+            if confirm is not None and self.due is not None and self.unconditional:
+                return
+            if confirm is None:
+                self.unconditional = True
+            now = time.monotonic()
+            due = now + (self.debounce if delay is None else delay)
+            if self.due is None:
+                self.first_request = now
+            else:
+                due = max(due, self.due)
+            self.due = min(due, self.first_request + self.max_delay)
+            self.condition.notify()
+
+    def next_batch(self):
+        """Blocks until the pending update is due, returns (reasons, max_wait, confirms, unconditional)"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wall_now = datetime.now()
+                while self.deadlines and self.deadlines[0][0] <= wall_now:
+                    reason = heapq.heappop(self.deadlines)[1]
+                    if reason in self.actions:
+                        self.run_action(reason)
+                        continue
+                    if self.due is None:
+                        self.due, self.first_request = now, now
+                    self.reasons.add(reason)
+                    self.unconditional = True
+                if self.due is None and now >= self.last_run + self.interval:
+                    self.due, self.first_request = now, now
+                    self.reasons.add("timer")
+                    self.unconditional = True
+                if self.due is not None and now >= self.due:
+                    batch = self.reasons, self.max_wait, self.confirms, self.unconditional
+                    self.due = self.max_wait = None
+                    self.reasons = set()
+                    self.confirms = []
+                    self.unconditional = False
+                    return batch
+                wake_at = self.due if self.due is not None else self.last_run + self.interval
+                timeout = wake_at - now
+                if self.deadlines:
+                    timeout = min(timeout, (self.deadlines[0][0] - wall_now).total_seconds())
+                self.condition.wait(min(timeout, 60))  # Re-check the wall clock after standby
+
+    def run_action(self, reason):
+        logging.info(f"{reason} - running {self.actions[reason].__name__}()")
+        try:
+            self.actions[reason]()
+        except Exception as e:
+            logging.error(f"Error handling {reason}: {e}")
+
+    def run(self):
+        while True:
+            reasons, max_wait, confirms, unconditional = self.next_batch()
+            confirmed = [confirm() for confirm in confirms]  # Every check runs, it moves its baseline
+            if not unconditional and not any(confirmed):
+                logging.info(f"No real change ({', '.join(sorted(reasons))}) - update skipped")
+                continue
+            logging.info(f"Updating wallpaper ({', '.join(sorted(reasons))})...")
+            try:
+                self.target(max_wait)
+            except Exception as e:
+                logging.error(f"Error in wallpaper update: {e}")
+            self.last_run = time.monotonic()
+            self.plan()
+
+    def plan(self):
+        """Rebuilds the heap of upcoming change instants after an update"""
+        if not self.upcoming:
+            return
+        try:
+            deadlines = list(self.upcoming())
+        except Exception as e:
+            logging.error(f"Error planning the next update: {e}")
+            deadlines = []
+        heapq.heapify(deadlines)
+        with self.condition:
+            self.deadlines = deadlines
+        if deadlines:
+            logging.info(f"Next expected change: {deadlines[0][1]} at {deadlines[0][0]:%H:%M:%S}")
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True, name="scheduler").start()
+
+def refresh_weather():
+    """Starts the background refresh of the weather; weather_cache.on_update requests the update once it arrived"""
+    gatherer.submit("weather")
+
+scheduler = RefreshScheduler(
+    wallpaper, UPDATE_INTERVAL, REFRESH_DEBOUNCE, REFRESH_MAX_DELAY, upcoming_changes,
+    actions={"weather expired": refresh_weather},
+)
+weather_cache.on_update = lambda: scheduler.request("weather refreshed")
+
+# --------------------------
+# LOCAL CONTROL API
+# --------------------------
+CHECKBOX_PATTERN = re.compile(r"^(\t*)- \[([ x])\]")
 
+def checked_int(value, name, minimum=0):
+    """value as an int >= minimum, raises ValueError otherwise (bools and strings included)"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"{name} must be an integer >= {minimum}")
+    return value
+
+def line_index(part):
+    """Line number from the URL, only plain non-negative integers"""
+    if not part.isdigit():
+        raise ValueError(f"Invalid line number: {part}")
+    return int(part)
+
+def check_line(lines, index):
+    if index >= len(lines):
+        raise IndexError(f"Line {index} does not exist")
+
+def add_todo(text, indent=0, position=None):
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("text must be a non-empty string")
+    if any(c in text for c in "\r\n\u2028\u2029"):
+        raise ValueError("text must be a single line")
+    indent = checked_int(indent, "indent")
+    position = None if position is None else checked_int(position, "position")
+
+    def change(lines):
+        if position is not None and position > len(lines):
+            raise IndexError(f"Position {position} is after the last line")
+        lines.insert(len(lines) if position is None else position, "\t" * indent + f"- [ ] {text}")
+        return lines
+    return change
+
+def toggle_todo(index):
+    def change(lines):
+        check_line(lines, index)
+        match = CHECKBOX_PATTERN.match(lines[index])
+        if not match:
+            raise ValueError(f"Line {index} has no checkbox")
+        mark = " " if match.group(2) == "x" else "x"
+        lines[index] = f"{match.group(1)}- [{mark}]" + lines[index][match.end():]
+        return lines
+    return change
+
+def remove_todo(index):
+    def change(lines):
+        check_line(lines, index)
+        del lines[index]
+        return lines
+    return change
+
+source_invalidators = {
+    "timetable": untis.invalidate,
+    "weather": weather_cache.invalidate,
+    "todos": lambda: None,  # todo.md is read on every update anyway
+}
+
+def control_status():
+    """What the status command reports"""
+    with scheduler.condition:
+        next_change = scheduler.deadlines[0] if scheduler.deadlines else None
+    return {
+        "update": tracer.update_id,
+        "todos": len(todo_document.rows),
+        "unsaved": todo_document.unsaved is not None,
+        "sources": sorted(gatherer.results),
+        "fetching": sorted(gatherer.pending),
+        "next_change": [next_change[0].isoformat(), next_change[1]] if next_change else None,
+        "timings": tracer.summary(),
+    }
+
+class ControlHandler(http.server.BaseHTTPRequestHandler):
+    """Local HTTP commands:
+
+    GET /status, GET /todos, POST /todos {"text", "indent", "position"},
+    POST /todos/<line>/toggle, DELETE /todos/<line>, POST /refresh/<source|all>
+
+    Requests other than GET must be sent as application/json. Requests
+    carrying an Origin header (web pages) or a Host other than 127.0.0.1 or
+    localhost with our port (DNS rebinding) are refused.
+    """
+    def reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_command(self, method):
+        if CONTROL_TOKEN and self.headers.get("X-Token") != CONTROL_TOKEN:
+            return self.reply(403, {"error": "forbidden"})
+        # Browsers send Origin with every cross-site request; scripts and plugins do not
+        if self.headers.get("Origin") is not None:
+            return self.reply(403, {"error": "requests from web pages are not accepted"})
+        port = self.server.server_address[1]
+        if self.headers.get("Host", "").lower() not in (f"127.0.0.1:{port}", f"localhost:{port}"):
+            return self.reply(403, {"error": "unexpected Host"})
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if method != "GET" and content_type != "application/json":
+            return self.reply(415, {"error": "Content-Type must be application/json"})
+
+        parts = self.path.strip("/").split("/")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or "{}")
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+
+            if method == "GET" and parts == ["status"]:
+                return self.reply(200, control_status())
+            if method == "GET" and parts == ["todos"]:
+                with todo_document.lock:
+                    lines = todo_document.unsaved
+                return self.reply(200, {"lines": lines if lines is not None else todo_document.read_lines() or []})
+
+            if parts[0] == "todos":
+                if method == "POST" and len(parts) == 1:
+                    change = add_todo(body["text"], body.get("indent", 0), body.get("position"))
+                elif method == "POST" and len(parts) == 3 and parts[2] == "toggle":
+                    change = toggle_todo(line_index(parts[1]))
+                elif method == "DELETE" and len(parts) == 2:
+                    change = remove_todo(line_index(parts[1]))
+                else:
+                    return self.reply(404, {"error": "unknown command"})
+                todo_document.edit(change)
+                scheduler.request(f"control: {method} {self.path}", delay=0, max_wait=CONTROL_MAX_WAIT)
+                try:
+                    todo_document.save()
+                except OSError as e:
+                    logging.error(f"Could not write {todo_document.path}: {e}")
+                    scheduler.request("control: edit rolled back", delay=0, max_wait=CONTROL_MAX_WAIT)
+                    return self.reply(500, {"error": f"todo file could not be written: {e}"})
+                todo_watcher.acknowledge(todo_document.path)  # Our own write is not a change
+                return self.reply(200, {"todos": len(todo_document.rows)})
+
+            if method == "POST" and parts[0] == "refresh" and len(parts) == 2:
+                names = list(source_invalidators) if parts[1] == "all" else [parts[1]]
+                for name in names:
+                    source_invalidators[name]()
+                scheduler.request(f"control: refresh {parts[1]}", delay=0)
+                return self.reply(200, {"refreshing": names})
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return self.reply(400, {"error": str(e)})
+        return self.reply(404, {"error": "unknown command"})
+
+    def do_GET(self):
+        self.handle_command("GET")
+
+    def do_POST(self):
+        self.handle_command("POST")
+
+    def do_DELETE(self):
+        self.handle_command("DELETE")
+
+    def log_message(self, format, *args):
+        logging.debug(f"Control API: {format % args}")
+
+def start_control_server(port=CONTROL_PORT):
+    """Serves ControlHandler on 127.0.0.1 in a background thread, None if disabled or the port is taken"""
+    if not port:
+        return None
     try:
-        while observer.is_alive():
-            observer.join(1)
-    except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", port), ControlHandler)
+    except OSError as e:
+        logging.error(f"Control API could not start on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="control").start()
+    logging.info(f"Control API listening on http://127.0.0.1:{port}")
+    return server
 
 # --------------------------
-# Automatische Aktualisierung alle 2 Minuten
+# FILE MONITORING
 # --------------------------
-def auto_update():
-    while True:
-        logging.info("Automatisches Update des Wallpapers...")
-        wallpaper()
-        time.sleep(240)  # Warte 4 Minuten (240 Sekunden)
+class WatchedFile:
+    """Change check for one file: (size, mtime) first, the content hash only if that differs.
+
+    The baseline is the content the last update saw: modified() compares
+    only the stat signature, confirm() hashes the file and moves the baseline.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.digest = None
+        self.reported = None  # Signature modified() last returned True for
+        self.lock = threading.Lock()
+
+    def state(self):
+        """Current (signature, digest), (None, None) if the file is missing"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature == self.signature:
+                return signature, self.digest
+            with open(self.path, "rb") as file:
+                return signature, hashlib.sha1(file.read()).hexdigest()
+        except FileNotFoundError:
+            return None, None
+
+    def acknowledge(self):
+        """Takes the current content as known, e.g. after the app wrote the file itself"""
+        with self.lock:
+            self.signature, self.digest = self.state()
+            self.reported = None
+
+    def modified(self):
+        """True once per new (size, mtime) that differs from the baseline"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            signature = None
+        with self.lock:
+            if signature in (self.signature, self.reported):
+                return False
+            self.reported = signature
+            return True
+
+    def confirm(self):
+        """True if the content differs from the baseline, which then becomes the current content"""
+        with self.lock:
+            signature, digest = self.state()
+            changed = digest != self.digest
+            self.signature, self.digest = signature, digest
+            self.reported = None
+            return changed
+
+def unreliable_filesystem(path):
+    """Network shares and sync folders, where change notifications get lost or arrive late"""
+    path = os.path.abspath(path)
+    if any(name in path.lower() for name in SYNC_FOLDER_NAMES):
+        return True
+    if sys.platform == "win32":
+        import ctypes
+        drive = os.path.splitdrive(path)[0]
+        if drive.startswith("\\\\"):
+            return True  # UNC-Pfad
+        DRIVE_REMOTE = 4
+        return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == DRIVE_REMOTE
+    try:
+        with open("/proc/mounts", encoding='utf-8') as file:
+            mounts = [line.split()[1:3] for line in file]
+    except OSError:
+        return False
+    matching = [m for m in mounts if path == m[0] or path.startswith(m[0].rstrip("/") + "/")]
+    if not matching:
+        return False
+    fs_type = max(matching, key=lambda m: len(m[0]))[1]
+    return fs_type in ("nfs", "nfs4", "cifs", "smbfs", "smb3", "9p", "afs") or fs_type.startswith("fuse.")
+
+class TodoWatcher(FileSystemEventHandler):
+    """Watches only the given files and schedules an update when their content really changed.
+
+    Uses file system events on the files' directories, ignoring every other
+    file there (wallpaper.log, metrics.jsonl, cache/, output/ ...), and falls
+    back to polling the files with stat() where events are unreliable.
+    """
+    def __init__(self, paths, mode, poll_interval):
+        self.files = {os.path.normcase(os.path.abspath(path)): WatchedFile(path) for path in paths}
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.observer = None
+        self.stopped = threading.Event()
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            watched = self.files.get(os.path.normcase(path)) if path else None
+            if watched:
+                self.check(watched)
+
+    def check(self, watched):
+        """Schedules a conditional update; the content is compared once the debounce is over"""
+        if watched.modified():
+            name = os.path.basename(watched.path)
+            logging.debug(f"{name} modified - checking its content after the debounce")
+            scheduler.request(f"{name} changed", confirm=watched.confirm)
+
+    def acknowledge(self, path):
+        self.files[os.path.normcase(os.path.abspath(path))].acknowledge()
+
+    def poll(self):
+        while not self.stopped.wait(self.poll_interval):
+            for watched in self.files.values():
+                self.check(watched)
+
+    def start(self):
+        for watched in self.files.values():
+            watched.acknowledge()  # Current content is the baseline
+        polling = self.mode == "poll" or (
+            self.mode == "auto" and any(unreliable_filesystem(path) for path in self.files)
+        )
+        if not polling:
+            try:
+                self.observer = Observer()
+                for directory in {os.path.dirname(path) for path in self.files}:
+                    if os.path.isdir(directory):
+                        self.observer.schedule(self, path=directory, recursive=False)
+                self.observer.start()
+            except OSError as e:
+                logging.error(f"File events unavailable ({e}) - polling instead")
+                self.observer = None
+                polling = True
+
+        if polling:
+            threading.Thread(target=self.poll, daemon=True, name="watcher").start()
+        names = ", ".join(os.path.basename(watched.path) for watched in self.files.values())
+        logging.info(f"Watching {names} ({f'polling every {self.poll_interval}s' if polling else 'file events'})")
+
+    def stop(self):
+        self.stopped.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+
+todo_watcher = TodoWatcher(WATCHED_PATHS, WATCH_MODE, WATCH_POLL_INTERVAL)
+
+def watch():
+    """Starts the control API and the file watcher, then runs until interrupted"""
+    start_control_server()
+    todo_watcher.start()
+    try:
+        while not todo_watcher.stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        todo_watcher.stop()
 
 # --------------------------
 # MAIN PROGRAM
@@ -518,10 +2530,13 @@ if __name__ == "__main__":
     logging.info("Starting wallpaper engine...")
     #print(f"Font folder exists: {os.path.exists(FONT_FOLDER)}")
     #print(f"Font file exists: {os.path.exists(os.path.join(FONT_FOLDER, FONT_NAME))}")
-    #wallpaper()  # Initial execution
 
-    # Starte den Thread für die automatische Aktualisierung
-    auto_update_thread = threading.Thread(target=auto_update, daemon=True)
-    auto_update_thread.start()
+    if RENDER_WORKER:
+        render_pool.warm_up(get_display_size())  # Startet, während die Daten geladen werden
+
+    # Sofort mit den zuletzt gespeicherten Daten zeichnen, danach mit Live-Daten
+    wallpaper(max_wait=STARTUP_MAX_WAIT)
+    scheduler.request("startup", delay=0)
+    scheduler.start()
     
     watch()
\ No newline at end of file
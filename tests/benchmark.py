@@ -0,0 +1,211 @@
+"""Benchmark for the parse, layout, render and save stages of the wallpaper engine.
+
+Uses only synthetic data (no WebUntis, weather or desktop access) and prints
+one JSON object per measurement. Memory is reported per measurement as the
+peak of the Python heap (tracemalloc) and the growth of the resident set
+during one run, which also covers Pillow's image buffers, e.g.:
+
+    python tests/benchmark.py --output bench_new.json
+    python tests/benchmark.py --compare bench_old.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import tempfile
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("WALLPAPER_BACKEND", "file")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from PIL import Image
+
+RESOLUTIONS = {"1080p": (1920, 1080), "1440p": (2560, 1440), "4k": (3840, 2160)}
+TODO_SIZES = [50, 500, 5000]
+TODO_DEPTHS = [0, 3, 8]
+WORDS = "Lat HÜ lesen Test SA Wdhl. Fragen :smile: :books: kaufen USB-Stick Mathe Englisch Vokabeln Referat".split()
+
+def make_todo_file(path, lines, depth, seed=1):
+    """Writes a synthetic todo.md with nested, partly checked tasks"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as file:
+        for _ in range(lines):
+            indent = "\t" * rng.randint(0, depth)
+            box = rng.choice(["- [ ] ", "- [ ] ", "- [x] ", "- ", ""])
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 14)))
+            file.write(f"{indent}{box}{text}\n")
+
+def make_timetable():
+    """Fake lessons and holidays in the format time_table() returns"""
+    start = datetime.now().replace(hour=8, minute=0)
+    lessons = []
+    for i, subject in enumerate(["M", "D", "E", "L", "BIU", "GSPB", "PH"]):
+        begin = start + timedelta(minutes=55 * i)
+        lessons.append((f"{begin.strftime('%H:%M')} - {(begin + timedelta(minutes=50)).strftime('%H:%M')}: {subject} in 1A", "normal"))
+    lessons[2] = (lessons[2][0] + " (Vertretung: Huber)", "changed")
+    holidays = ["Nächsten 10 Ferien/Feiertage:\n"] + [f"Feiertag {i}: 0{i}.12.2026" for i in range(1, 10)]
+    holidays.append("\nNächste(r) Ferien/Feiertag: 01.12.2026\nIn 44 Tag(en)")
+    return main.add_weather((lessons, holidays), "Wetter in Graz: 12°C, Bewölkung: 50%\n\nStand: 12:00:00")
+
+def make_background(path, size):
+    """Gradient background so PNG compression has realistic work to do"""
+    gradient = Image.linear_gradient("L").resize(size)
+    Image.merge("RGB", (gradient, gradient.rotate(90).resize(size), gradient.transpose(Image.FLIP_LEFT_RIGHT))).save(path)
+
+def rss_kb():
+    rss = main.process_rss()
+    return rss // 1024 if rss is not None else None
+
+def reset_peak_rss():
+    """Restarts the kernel's high-water mark of the resident set, False where that is not possible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb():
+    with open("/proc/self/status") as file:
+        return next(int(line.split()[1]) for line in file if line.startswith("VmHWM:"))
+
+def measure(func, repeat):
+    """Runs func repeat times, returns (result, durations in seconds, memory in KiB)"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+
+    # Extra runs for memory, tracemalloc slows Python code down too much to time it
+    tracemalloc.start()
+    func()
+    memory = {"peak_python_kb": tracemalloc.get_traced_memory()[1] // 1024}
+    tracemalloc.stop()
+
+    before = rss_kb()
+    peak_known = reset_peak_rss()
+    kept = func()
+    after = rss_kb()
+    memory["rss_delta_kb"] = after - before if before is not None and after is not None else None
+    memory["peak_rss_delta_kb"] = peak_rss_kb() - before if peak_known and before is not None else None
+    del kept
+    return result, durations, memory
+
+def record(stage, case, durations, memory, work, unit):
+    median = statistics.median(durations)
+    return dict({
+        "stage": stage,
+        "case": case,
+        "runs": len(durations),
+        "min_ms": round(min(durations) * 1000, 3),
+        "median_ms": round(median * 1000, 3),
+        f"{unit}_per_s": round(work / median, 1) if median else None,
+    }, **memory)
+
+def run(repeat, resolutions, todo_sizes, depths):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        todo_path = os.path.join(tmp, "todo.md")
+        timetable = make_timetable()
+        deepest = {}  # Parsed todos of the largest file per depth
+
+        for lines, depth in itertools.product(todo_sizes, depths):
+            make_todo_file(todo_path, lines, depth)
+            case = f"{lines} lines, depth {depth}"
+
+            def parse_cold():
+                main.todo_document = main.TodoDocument(todo_path)
+                return main.process_todos()
+            todos, durations, memory = measure(parse_cold, repeat)
+            results.append(record("parse", f"{case}, cold", durations, memory, lines, "lines"))
+            deepest[depth] = list(todos)
+
+            # Edit one line in the middle and parse it incrementally
+            with open(todo_path, encoding="utf-8") as file:
+                raw = file.readlines()
+            def parse_edit():
+                raw[lines // 2] = f"- [ ] edited {time.perf_counter()}\n"
+                with open(todo_path, "w", encoding="utf-8") as file:
+                    file.writelines(raw)
+                return main.process_todos()
+            _, durations, memory = measure(parse_edit, repeat)
+            results.append(record("parse", f"{case}, one edit", durations, memory, lines, "lines"))
+        todos = deepest[max(depths)]
+
+        for name in resolutions:
+            size = RESOLUTIONS[name]
+            background = os.path.join(tmp, f"background_{name}.png")
+            make_background(background, size)
+            megapixels = size[0] * size[1] / 1e6
+
+            # Line wrapping on its own, with the same panel size create_wallpaper_image uses
+            layout = main.layout_for(size)
+            fnt = main.load_font("emoji", layout.font_size)
+            x0, y0 = layout.todo_origin(len(timetable[0]))
+            panel_size = (size[0] - x0, size[1] - y0)
+            for depth, nested in deepest.items():
+                def layout_cold():
+                    main.wrap_row.cache_clear()
+                    return main.wrap_todos(nested, fnt, panel_size, layout)
+                rows, durations, memory = measure(layout_cold, repeat)
+                results.append(record("layout", f"{name}, depth {depth}, wrap", durations, memory, len(rows), "rows"))
+
+            def render_full():
+                main.renderer = main.WallpaperRenderer()
+                main.backgrounds = main.BackgroundCache()
+                return main.create_wallpaper_image(todos, timetable, background_path=background, size=size)
+            image, durations, memory = measure(render_full, repeat)
+            results.append(record("render", f"{name}, full", durations, memory, megapixels, "megapixels"))
+
+            def render_edit():
+                todos[1] = ("-", f"edited {time.perf_counter()}", False, 1, False)
+                return main.create_wallpaper_image(todos, timetable, background_path=background, size=size)
+            image, durations, memory = measure(render_edit, repeat)
+            results.append(record("render", f"{name}, one todo changed", durations, memory, megapixels, "megapixels"))
+
+            for output_format, (extension, _, _) in main.OUTPUT_FORMATS.items():
+                output = os.path.join(tmp, f"out_{name}{extension}")
+                _, durations, memory = measure(lambda: main.save_image(image, output, output_format), repeat)
+                megabytes = os.path.getsize(output) / 1e6
+                results.append(record("save", f"{name}, {output_format}", durations, memory, megabytes, "megabytes"))
+    return results
+
+def compare(results, previous_path):
+    """Prints the change of every median against a previous run"""
+    with open(previous_path, encoding="utf-8") as file:
+        previous = {(r["stage"], r["case"]): r for r in (json.loads(line) for line in file if line.strip())}
+    for result in results:
+        old = previous.get((result["stage"], result["case"]))
+        if old and old["median_ms"]:
+            change = (result["median_ms"] / old["median_ms"] - 1) * 100
+            print(f"{result['stage']:7} {result['case']:36} {old['median_ms']:10.2f} ms -> {result['median_ms']:10.2f} ms ({change:+.1f}%)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--todos", nargs="+", type=int, default=TODO_SIZES, help="todo.md sizes in lines")
+    parser.add_argument("--depths", nargs="+", type=int, default=TODO_DEPTHS, help="maximum nesting depths of tasks")
+    parser.add_argument("--output", help="also write the JSON lines to this file")
+    parser.add_argument("--compare", help="JSON lines file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    main.logging.getLogger().setLevel(main.logging.WARNING)
+    results = run(args.repeat, args.resolutions, args.todos, args.depths)
+    meta = {"python": platform.python_version(), "platform": platform.platform(), "time": datetime.now().isoformat()}
+
+    lines = [json.dumps(dict(result, **meta), ensure_ascii=False) for result in results]
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+    if args.compare:
+        compare(results, args.compare)